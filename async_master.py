@@ -0,0 +1,285 @@
+import asyncio
+import time
+from functools import partial
+from master import ModbusMaster, ASCII_MODE, RTU_MODE
+from batch import BATCH, encode_commands, pack_entries, decode_results
+from compression import COMPRESSION, OFFER
+from registers import (READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS, WRITE_SINGLE_REGISTER,
+                       WRITE_MULTIPLE_COILS, WRITE_MULTIPLE_REGISTERS, RANGE,
+                       encode_read, encode_write_registers, encode_write_coils,
+                       decode_registers, write_acknowledged)
+from framing import FrameDecoder
+from tracing import SENT, RECEIVED
+
+
+class AsyncModbusMaster(ModbusMaster):
+    def __init__(self, port, mode=ASCII_MODE, tracer=None, read_cache=None, metrics=None):
+        super().__init__(port, mode, tracer, read_cache, metrics)
+        self.port.timeout = 0
+        self.decoder = FrameDecoder(mode, replies=True)
+        self.decoder.on_discard = self.count_discarded
+        self.requests = None
+        self.responses = None
+        self.worker = None
+        self.silence_timer = None
+        self.loop = None
+        self.pending_reads = {}
+
+    def set_mode(self, mode):
+        super().set_mode(mode)
+        self.decoder.mode = mode
+        self.decoder.reset()
+
+    def start(self):
+        if self.worker is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.requests = asyncio.Queue()
+        self.responses = asyncio.Queue()
+        self.loop.add_reader(self.port.fileno(), self.on_readable)
+        self.worker = self.loop.create_task(self.process_requests())
+
+    async def close(self):
+        if self.worker is None:
+            return
+        self.loop.remove_reader(self.port.fileno())
+        if self.silence_timer is not None:
+            self.silence_timer.cancel()
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        while not self.requests.empty():
+            _, future = self.requests.get_nowait()
+            if not future.done():
+                future.cancel()
+        self.worker = None
+
+    def submit(self, slave_address, command, data):
+        self.start()
+        cache = self.read_cache
+        if cache is None or slave_address == 0 or command not in self.read_commands:
+            return self.enqueue(partial(self.transact, slave_address, command, data))
+
+        key = (slave_address, command, bytes(data))
+        response = cache.get(key)
+        if response is not None:
+            future = self.loop.create_future()
+            future.set_result(response)
+            return future
+        future = self.pending_reads.get(key)
+        if future is not None:
+            cache.coalesced += 1
+            return future
+        cache.misses += 1
+        future = self.enqueue(partial(self.transact, slave_address, command, data))
+        self.pending_reads[key] = future
+        future.add_done_callback(lambda done: self.finish_read(key, done))
+        return future
+
+    # Jobs are coroutine functions run one at a time by the worker, so each
+    # has the line to itself.
+    def enqueue(self, job):
+        future = self.loop.create_future()
+        self.requests.put_nowait((job, future))
+        return future
+
+    def finish_read(self, key, future):
+        del self.pending_reads[key]
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            self.read_cache.put(key, future.result())
+
+    async def send_frame(self, slave_address, command, data):
+        return await self.submit(slave_address, command, data) is not None
+
+    async def request(self, slave_address, command, data):
+        return await self.submit(slave_address, command, data)
+
+    async def request_pdu(self, slave_address, command, data):
+        # Bypasses the read cache, which only holds payloads.
+        self.start()
+        return await self.enqueue(partial(self.transact_pdu, slave_address, command, data))
+
+    async def transact_pdu(self, slave_address, command, data):
+        response = await self.transact(slave_address, command, data)
+        if response is None:
+            return None
+        return self.reply_function(command), response
+
+    # The helpers below mirror ModbusMaster's, awaiting the requests.
+
+    async def upgrade_link(self, slave_addresses, baudrate, mode=RTU_MODE, verify_timeout=2.0):
+        return await self.run_steps(self.link_upgrade(slave_addresses, baudrate, mode, verify_timeout))
+
+    async def send_batch(self, frames):
+        await self.run_steps(self.batch_writes(frames))
+
+    # Queues the steps as one job, e.g. a ChunkedTransfer, and returns a
+    # future for their result.
+    def run_steps(self, steps):
+        self.start()
+        return self.enqueue(partial(self.run_steps_async, steps))
+
+    # Runs on the worker, so requests go straight to transact.
+    async def run_steps_async(self, steps):
+        reply = None
+        try:
+            while True:
+                step = steps.send(reply)
+                if isinstance(step, tuple):
+                    reply = await self.transact(*step)
+                else:
+                    await asyncio.sleep(step)
+                    reply = None
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            steps.close()
+
+    async def negotiate_compression(self, slave_address):
+        return self.compression_reply(slave_address, await self.request(slave_address, COMPRESSION, OFFER))
+
+    async def write_text(self, slave_address, text):
+        return await self.send_frame(slave_address, *self.text_write(slave_address, text))
+
+    async def read_text(self, slave_address):
+        command = self.text_read_command(slave_address)
+        return self.decode_text(slave_address, command, await self.request(slave_address, command, b''))
+
+    async def read_holding_registers(self, slave_address, start, count):
+        reply = await self.request(slave_address, READ_HOLDING_REGISTERS, encode_read(start, count))
+        return decode_registers(reply, count)
+
+    async def read_input_registers(self, slave_address, start, count):
+        reply = await self.request(slave_address, READ_INPUT_REGISTERS, encode_read(start, count))
+        return decode_registers(reply, count)
+
+    async def write_register(self, slave_address, index, value):
+        reply = await self.request(slave_address, WRITE_SINGLE_REGISTER, RANGE.pack(index, value))
+        return write_acknowledged(reply)
+
+    async def write_registers(self, slave_address, start, values):
+        reply = await self.request(slave_address, WRITE_MULTIPLE_REGISTERS,
+                                   encode_write_registers(start, values))
+        return write_acknowledged(reply)
+
+    async def write_coils(self, slave_address, start, values):
+        reply = await self.request(slave_address, WRITE_MULTIPLE_COILS,
+                                   encode_write_coils(start, values))
+        return write_acknowledged(reply)
+
+    async def request_batch(self, slave_address, commands):
+        reply = await self.request(slave_address, BATCH, encode_commands(slave_address, commands))
+        return None if reply is None else decode_results(reply)
+
+    async def broadcast_batch(self, entries):
+        frames = [(0, BATCH, payload) for payload in pack_entries(entries)]
+        await self.send_batch(frames)
+        return len(frames)
+
+    async def process_requests(self):
+        while True:
+            job, future = await self.requests.get()
+            if future.cancelled():
+                continue
+            try:
+                result = await job()
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(result)
+
+    async def transact(self, slave_address, command, data):
+        self.reply_header = None
+        frame = self.encoder.encode(self.mode, slave_address, command, data)
+        wire_time = len(frame) * self.char_time
+
+        tracer = self.tracer
+        metrics = self.metrics
+        retries = 0
+        while retries <= self.retransmissions:
+            if retries:
+                await asyncio.sleep(self.retry_delay(retries))
+            delay = self.idle_delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.discard_responses()
+            if tracer.debug_enabled:
+                tracer.debug("Master sending frame: %s", bytes(frame))
+            self.record_frame(SENT, frame)
+            self.port.write(frame)
+            sent = time.monotonic()
+            self.line_idle_at = sent + wire_time
+            metrics.inc('frames_sent', slave=slave_address)
+            if retries:
+                metrics.inc('retries', slave=slave_address)
+
+            if slave_address == 0 or command in self.unanswered_commands:
+                tracer.debug("=================Master complete=================")
+                return b''
+
+            tracer.debug("===============Master Awaiting RES===============")
+            self.expected = (slave_address, command)
+            if await self.receive_response(self.response_timeout(slave_address, wire_time)):
+                elapsed = time.monotonic() - sent
+                metrics.observe('round_trip_seconds', elapsed, slave=slave_address)
+                if retries == 0:
+                    self.record_round_trip(
+                        slave_address, elapsed - wire_time - self.frame_time(self.response))
+                tracer.debug("=================Master complete=================")
+                return self.response
+            metrics.inc(self.failure, slave=slave_address)
+            self.record_timeout(slave_address)
+            retries += 1
+            tracer.warning("============FAILED TO OBTAIN RESPONSE============")
+            tracer.warning("Retry: %d", retries)
+        return None
+
+    async def receive_response(self, timeout=None):
+        if timeout is None:
+            timeout = self.transaction_timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                response = await asyncio.wait_for(self.responses.get(), timeout)
+            except asyncio.TimeoutError:
+                response = b''
+            self.line_idle_at = time.monotonic()
+            self.tracer.debug("Master received response: %s", response)
+            self.record_frame(RECEIVED, response)
+            self.response = None
+            if not self.validate_response(response):
+                return False
+            if self.matches_request():
+                return True
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                self.failure = 'timeouts'
+                return False
+
+    def discard_responses(self):
+        self.decoder.reset()
+        while not self.responses.empty():
+            self.responses.get_nowait()
+
+    def on_readable(self):
+        waiting = self.port.in_waiting
+        if not waiting:
+            return
+        self.decoder.feed(self.port.read(waiting))
+        while self.decoder.frames:
+            self.responses.put_nowait(self.decoder.next_frame())
+        if self.decoder.buffer:
+            if self.silence_timer is not None:
+                self.silence_timer.cancel()
+            self.silence_timer = self.loop.call_later(self.character_timeout, self.on_silence)
+
+    def on_silence(self):
+        self.silence_timer = None
+        self.decoder.flush()
+        while self.decoder.frames:
+            self.responses.put_nowait(self.decoder.next_frame())
+
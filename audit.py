@@ -0,0 +1,217 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from checksum import CRC_TABLE, CRC_WORD_TABLE, check_rtu_frame, check_ascii_frame
+from framing import ASCII_MODE, RTU_MODE
+from capture import CaptureReader, RECORD, MAGIC, NAME, DIRECTION_NAMES, MODE_NAMES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Frames checked per vectorized pass; bounds the temporary arrays, which
+# grow with the bytes a pass spans.
+FRAMES_PER_PASS = 1 << 18
+
+HEX_DIGITS = b'0123456789ABCDEFabcdef'
+
+if np is not None:
+    CRC_BYTES = np.array(CRC_TABLE, dtype=np.uint16)
+    CRC_WORDS = np.frombuffer(CRC_WORD_TABLE, dtype=np.uint16)
+    # Hex digit value of every byte, 0xFF for anything that is not one.
+    HEX_VALUES = np.full(256, 0xFF, dtype=np.uint8)
+    for digit, value in zip(b'0123456789ABCDEF', range(16)):
+        HEX_VALUES[digit] = value
+    for digit, value in zip(b'abcdef', range(10, 16)):
+        HEX_VALUES[digit] = value
+
+
+# Bulk checksum validation for many frames held in one buffer. Frame i is
+# buffer[starts[i]:ends[i]]; for frames packed back to back that is
+# offsets[i]:offsets[i + 1]. Without numpy the same API falls back to the
+# per-frame checks in checksum.
+
+def pack_frames(frames):
+    offsets = [0]
+    for frame in frames:
+        offsets.append(offsets[-1] + len(frame))
+    return b''.join(frames), offsets
+
+def check_packed(buffer, offsets, mode, workers=0):
+    return check_frames(buffer, offsets[:-1], offsets[1:], mode, workers)
+
+def check_frames(buffer, starts, ends, mode, workers=0):
+    # Returns (mask, errors): a boolean per frame and the number of bad
+    # frames per address byte, as far as the address could still be read.
+    if workers and len(starts) > workers:
+        return check_in_pool(buffer, starts, ends, mode, workers)
+    if np is None:
+        return check_frames_python(buffer, starts, ends, mode)
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    check = check_ascii_vectorized if mode == ASCII_MODE else check_rtu_vectorized
+    masks = []
+    counts = np.zeros(256, dtype=np.int64)
+    for first in range(0, len(starts), FRAMES_PER_PASS):
+        pass_starts = starts[first:first + FRAMES_PER_PASS]
+        pass_ends = ends[first:first + FRAMES_PER_PASS]
+        base = int(pass_starts.min())
+        top = int(pass_ends.max())
+        mask, addresses = check(data[base:top], pass_starts - base, pass_ends - base)
+        bad = addresses[~mask]
+        counts += np.bincount(bad[bad >= 0], minlength=256)
+        masks.append(mask)
+    mask = np.concatenate(masks) if masks else np.zeros(0, dtype=bool)
+    return mask, {int(address): int(counts[address]) for address in np.nonzero(counts)[0]}
+
+def check_frames_python(buffer, starts, ends, mode):
+    check = check_ascii_frame if mode == ASCII_MODE else check_rtu_frame
+    view = memoryview(buffer)
+    mask = []
+    errors = {}
+    for start, end in zip(starts, ends):
+        frame = bytes(view[start:end])
+        good = check(frame)
+        mask.append(good)
+        if not good:
+            address = frame_address(frame, mode)
+            if address is not None:
+                errors[address] = errors.get(address, 0) + 1
+    return mask, errors
+
+def frame_address(frame, mode):
+    if mode == RTU_MODE:
+        return frame[0] if frame else None
+    pair = frame[1:3]
+    if len(pair) == 2 and all(digit in HEX_DIGITS for digit in pair):
+        return int(pair, 16)
+    return None
+
+def check_rtu_vectorized(data, starts, ends):
+    lengths = ends - starts
+    count = len(starts)
+    # Sorted longest first, the frames still running at any byte position
+    # are a prefix, so the CRC advances column by column over all frames.
+    order = np.argsort(-lengths, kind='stable')
+    sorted_starts = starts[order]
+    sorted_lengths = lengths[order]
+    crc = np.full(count, 0xFFFF, dtype=np.uint16)
+    longest = int(sorted_lengths[0]) if count else 0
+    descending = -sorted_lengths
+    for position in range(0, longest, 2):
+        pairs = int(np.searchsorted(descending, -(position + 2), side='right'))
+        singles = int(np.searchsorted(descending, -(position + 1), side='right'))
+        if pairs:
+            index = sorted_starts[:pairs] + position
+            word = data[index].astype(np.uint16) | (data[index + 1].astype(np.uint16) << 8)
+            crc[:pairs] = CRC_WORDS[crc[:pairs] ^ word]
+        if singles > pairs:
+            tail = crc[pairs:singles]
+            byte = data[sorted_starts[pairs:singles] + position]
+            crc[pairs:singles] = (tail >> 8) ^ CRC_BYTES[(tail ^ byte) & 0xFF]
+    good = np.empty(count, dtype=bool)
+    good[order] = (crc == 0) & (sorted_lengths >= 3)
+    addresses = np.where(lengths > 0, data[np.minimum(starts, len(data) - 1)].astype(np.int64), -1)
+    return good, addresses
+
+def check_ascii_vectorized(data, starts, ends):
+    lengths = ends - starts
+    last = len(data) - 1
+    nibbles = HEX_VALUES[data]
+    # Prefix sums of the nibble values at even and at odd buffer positions,
+    # and of non-hex characters, turn every per-frame sum into two lookups.
+    even = np.zeros(len(nibbles[0::2]) + 1, dtype=np.int64)
+    np.cumsum(nibbles[0::2], out=even[1:])
+    odd = np.zeros(len(nibbles[1::2]) + 1, dtype=np.int64)
+    np.cumsum(nibbles[1::2], out=odd[1:])
+    invalid = np.zeros(len(nibbles) + 1, dtype=np.int64)
+    np.cumsum(nibbles == 0xFF, out=invalid[1:])
+
+    body_start = starts + 1
+    body_end = np.maximum(ends - 2, body_start)
+    framed = ((lengths >= 5) & ((lengths - 3) % 2 == 0)
+              & (data[np.minimum(starts, last)] == ord(':'))
+              & (data[np.clip(ends - 2, 0, last)] == ord('\r'))
+              & (data[np.clip(ends - 1, 0, last)] == ord('\n')))
+    clean = invalid[body_end] - invalid[body_start] == 0
+    # High nibbles sit at the body's even offsets, i.e. at buffer positions
+    # with the same parity as body_start.
+    even_sum = even[(body_end + 1) // 2] - even[(body_start + 1) // 2]
+    odd_sum = odd[body_end // 2] - odd[body_start // 2]
+    high_on_even = body_start % 2 == 0
+    high = np.where(high_on_even, even_sum, odd_sum)
+    low = np.where(high_on_even, odd_sum, even_sum)
+    good = framed & clean & ((16 * high + low) % 256 == 0)
+
+    first = nibbles[np.clip(body_start, 0, last)].astype(np.int64)
+    second = nibbles[np.clip(body_start + 1, 0, last)].astype(np.int64)
+    readable = (lengths >= 3) & (first != 0xFF) & (second != 0xFF)
+    addresses = np.where(readable, first * 16 + second, -1)
+    return good, addresses
+
+def check_in_pool(buffer, starts, ends, mode, workers):
+    # Each worker gets a contiguous run of frames and only the bytes they
+    # span, rebased to zero.
+    view = memoryview(buffer)
+    size = -(-len(starts) // workers)
+    jobs = []
+    for first in range(0, len(starts), size):
+        chunk_starts = list(starts[first:first + size])
+        chunk_ends = list(ends[first:first + size])
+        base = min(chunk_starts)
+        top = max(chunk_ends)
+        jobs.append((bytes(view[base:top]),
+                     [start - base for start in chunk_starts],
+                     [end - base for end in chunk_ends]))
+    mask = []
+    errors = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(check_frames, chunk, chunk_starts, chunk_ends, mode)
+                   for chunk, chunk_starts, chunk_ends in jobs]
+        for future in futures:
+            chunk_mask, chunk_errors = future.result()
+            mask.extend(chunk_mask)
+            for address, count in chunk_errors.items():
+                errors[address] = errors.get(address, 0) + count
+    if np is not None:
+        mask = np.array(mask, dtype=bool)
+    return mask, errors
+
+
+def index_capture(reader, direction=None):
+    # Frame positions inside a CaptureReader's mapping, per mode, so a whole
+    # capture can be checked in place without copying a frame.
+    positions = {ASCII_MODE: ([], []), RTU_MODE: ([], [])}
+    view = reader.view
+    offset = len(MAGIC)
+    end = len(view)
+    size = RECORD.size
+    while offset + size <= end:
+        _, length, _, record_direction, mode = RECORD.unpack_from(view, offset)
+        offset += size
+        if offset + length > end:
+            break
+        if record_direction != NAME and (direction is None or DIRECTION_NAMES[record_direction] == direction):
+            starts, ends = positions[MODE_NAMES[mode]]
+            starts.append(offset)
+            ends.append(offset + length)
+        offset += length
+    return positions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check every frame checksum in a capture file")
+    parser.add_argument('path')
+    parser.add_argument('--workers', type=int, default=0, help="split the work over this many processes")
+    args = parser.parse_args()
+
+    with CaptureReader(args.path) as reader:
+        for mode, (starts, ends) in index_capture(reader).items():
+            if not starts:
+                continue
+            mask, errors = check_frames(reader.map, starts, ends, mode, args.workers)
+            bad = len(starts) - int(sum(mask))
+            print(f"{mode}: {len(starts)} frames, {bad} bad")
+            for address, count in sorted(errors.items()):
+                print(f"  address {address}: {count} bad")
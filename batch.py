@@ -0,0 +1,100 @@
+from transfer import MAX_DATA
+from registers import ModbusError, ILLEGAL_DATA_VALUE, exception_reply
+
+# User-defined function code for several commands in one frame. Each entry
+# is [address][command][length][data]; a slave runs the entries for its own
+# address and those for address 0, in order. The reply to an addressed batch
+# holds [command][length][data] for every entry run, with NO_RESPONSE as the
+# length when the command has nothing to say and command | 0x80 for a
+# command the slave does not support. A command that fails with a Modbus
+# exception reports command | 0x80 with the exception code as its data, as
+# does one whose reply would not fit in the frame; such a command has still
+# run, only its reply is lost.
+BATCH = 70
+
+ENTRY_HEADER = 3
+RESULT_HEADER = 2
+EXCEPTION_RESULT = RESULT_HEADER + 1
+NO_RESPONSE = 0xFF
+
+
+def encode_entries(entries):
+    payload = bytearray()
+    for address, command, data in entries:
+        if len(data) >= NO_RESPONSE:
+            raise ValueError(f"Batch entry too long: {len(data)} bytes")
+        payload += bytes((address, command, len(data)))
+        payload += data
+    if len(payload) > MAX_DATA:
+        raise ValueError(f"Batch does not fit in one frame: {len(payload)} bytes")
+    return bytes(payload)
+
+def encode_commands(address, commands):
+    return encode_entries([(address, command, data) for command, data in commands])
+
+def pack_entries(entries):
+    # Splits entries into as few batch payloads as fit in a frame each.
+    payloads = []
+    current = []
+    size = 0
+    for entry in entries:
+        entry_size = ENTRY_HEADER + len(entry[2])
+        if current and size + entry_size > MAX_DATA:
+            payloads.append(encode_entries(current))
+            current = []
+            size = 0
+        current.append(entry)
+        size += entry_size
+    if current:
+        payloads.append(encode_entries(current))
+    return payloads
+
+def iter_entries(payload):
+    offset = 0
+    end = len(payload)
+    while offset + ENTRY_HEADER <= end:
+        address, command, length = payload[offset], payload[offset + 1], payload[offset + 2]
+        offset += ENTRY_HEADER
+        if offset + length > end:
+            return
+        yield address, command, payload[offset:offset + length]
+        offset += length
+
+def run_entries(payload, address, handlers, call):
+    # call(handler, data) runs one handler; returns the combined reply.
+    entries = [entry for entry in iter_entries(payload) if entry[0] == address or entry[0] == 0]
+    results = bytearray()
+    for index, (_, command, data) in enumerate(entries):
+        # Every later entry keeps room for at least an exception result, so
+        # each one gets a result however large the earlier replies are.
+        room = MAX_DATA - len(results) - EXCEPTION_RESULT * (len(entries) - index - 1)
+        handler = handlers.get(command)
+        if handler is None or command == BATCH:
+            results += bytes((command | 0x80, 0))
+            continue
+        try:
+            response = call(handler, data)
+        except ModbusError as e:
+            command, response = exception_reply(command, e.code)
+        if response is None:
+            results += bytes((command, NO_RESPONSE))
+            continue
+        if RESULT_HEADER + len(response) > room:
+            command, response = exception_reply(command, ILLEGAL_DATA_VALUE)
+        results += bytes((command, len(response)))
+        results += response
+    return bytes(results)
+
+def decode_results(reply):
+    results = []
+    offset = 0
+    end = len(reply)
+    while offset + RESULT_HEADER <= end:
+        command, length = reply[offset], reply[offset + 1]
+        offset += RESULT_HEADER
+        if length == NO_RESPONSE:
+            results.append((command, None))
+            continue
+        results.append((command, reply[offset:offset + length]))
+        offset += length
+    return results
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import platform
+import selectors
+import threading
+import time
+import tty
+from master import ModbusMaster, ASCII_MODE, RTU_MODE
+from slave import ModbusSlave
+from tracing import Tracer, OFF
+
+
+class PtyBus:
+    # One pty for the master and one per slave. A relay thread copies
+    # everything the master writes to every slave and everything a slave
+    # writes back to the master, like socat on a multi-drop line.
+    def __init__(self, slave_count, baudrate=None):
+        self.baudrate = baudrate
+        self.master_fd, self.master_tty_fd = self.open_pty()
+        self.slave_fds = []
+        self.slave_tty_fds = []
+        for _ in range(slave_count):
+            fd, tty_fd = self.open_pty()
+            self.slave_fds.append(fd)
+            self.slave_tty_fds.append(tty_fd)
+        self.master_name = os.ttyname(self.master_tty_fd)
+        self.slave_names = [os.ttyname(fd) for fd in self.slave_tty_fds]
+        self.selector = selectors.DefaultSelector()
+        self.running = True
+        self.wake_read, self.wake_write = os.pipe()
+        self.thread = threading.Thread(target=self.relay, daemon=True)
+        self.thread.start()
+
+    def open_pty(self):
+        fd, tty_fd = os.openpty()
+        tty.setraw(fd)
+        tty.setraw(tty_fd)
+        return fd, tty_fd
+
+    def line_delay(self, size):
+        if self.baudrate:
+            time.sleep(size * 10 / self.baudrate)
+
+    def relay(self):
+        self.selector.register(self.master_fd, selectors.EVENT_READ, None)
+        for fd in self.slave_fds:
+            self.selector.register(fd, selectors.EVENT_READ, fd)
+        self.selector.register(self.wake_read, selectors.EVENT_READ, 'wake')
+        while self.running:
+            for key, _ in self.selector.select():
+                if key.data == 'wake':
+                    return
+                try:
+                    data = os.read(key.fd, 4096)
+                except OSError:
+                    continue
+                self.line_delay(len(data))
+                if key.data is None:
+                    for fd in self.slave_fds:
+                        os.write(fd, data)
+                else:
+                    os.write(self.master_fd, data)
+
+    def close(self):
+        self.running = False
+        os.write(self.wake_write, b'x')
+        self.thread.join()
+        self.selector.close()
+        for fd in [self.master_fd, self.master_tty_fd, self.wake_read, self.wake_write] + \
+                self.slave_fds + self.slave_tty_fds:
+            os.close(fd)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_case(mode, payload_size, baudrate, slave_count, count):
+    bus = PtyBus(slave_count, baudrate)
+    master = ModbusMaster(bus.master_name, mode, tracer=Tracer(OFF))
+    if baudrate:
+        master.set_parameters(baudrate=baudrate, bytesize=8, parity='N', stopbits=1)
+    master.transaction_timeout = 1.0
+    master.retransmissions = 0
+    payload = b'x' * payload_size
+
+    slaves = []
+    threads = []
+    for address, name in enumerate(bus.slave_names, start=1):
+        slave = ModbusSlave(name, address, mode, tracer=Tracer(OFF))
+        if baudrate:
+            slave.set_parameters(baudrate=baudrate, bytesize=8, parity='N', stopbits=1)
+        slave.text = payload.decode()
+        slave.timeout = 0.1
+        thread = threading.Thread(target=slave.start, daemon=True)
+        thread.start()
+        slaves.append(slave)
+        threads.append(thread)
+
+    latencies = []
+    failures = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(count):
+        address = i % slave_count + 1
+        started = time.perf_counter()
+        if master.send_frame(address, 2, payload):
+            latencies.append(time.perf_counter() - started)
+        else:
+            failures += 1
+    elapsed = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    for slave in slaves:
+        slave.stop()
+    for thread in threads:
+        thread.join()
+    for slave in slaves:
+        slave.port.close()
+    master.port.close()
+    bus.close()
+
+    return {
+        'mode': mode,
+        'payload_size': payload_size,
+        'baudrate': baudrate,
+        'slaves': slave_count,
+        'transactions': count,
+        'failures': failures,
+        'elapsed': elapsed,
+        'frames_per_second': (count - failures) / elapsed if elapsed else None,
+        'cpu_per_frame': cpu / count if count else None,
+        'latency_p50': percentile(latencies, 0.50),
+        'latency_p90': percentile(latencies, 0.90),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': max(latencies) if latencies else None,
+    }
+
+
+def run_suite(modes, payload_sizes, baudrates, slave_count, count):
+    results = []
+    for mode in modes:
+        for baudrate in baudrates:
+            for payload_size in payload_sizes:
+                result = run_case(mode, payload_size, baudrate, slave_count, count)
+                print(f"{mode:5} {baudrate:>7} baud {payload_size:>4} B: "
+                      f"{result['frames_per_second'] or 0:8.1f} frames/s  "
+                      f"p50 {1000 * (result['latency_p50'] or 0):7.2f} ms  "
+                      f"p99 {1000 * (result['latency_p99'] or 0):7.2f} ms  "
+                      f"cpu {1e6 * (result['cpu_per_frame'] or 0):7.1f} us/frame  "
+                      f"failures {result['failures']}")
+                results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modbus master/slave throughput and latency over pseudo-terminals")
+    parser.add_argument('--modes', nargs='+', default=[ASCII_MODE, RTU_MODE])
+    parser.add_argument('--payloads', nargs='+', type=int, default=[0, 16, 64, 120])
+    parser.add_argument('--baudrates', nargs='+', type=int, default=[9600, 115200],
+                        help="line speed simulated by the relay; 0 relays at full speed")
+    parser.add_argument('--slaves', type=int, default=1)
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    results = run_suite(args.modes, args.payloads, args.baudrates, args.slaves, args.count)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    # Fully encoded response frames keyed by (mode, address, command, version).
+    # Bumping the version of the data behind a response makes its old entries
+    # unreachable; invalidate() also drops them straight away.
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        frame = self.entries.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return frame
+
+    def put(self, key, frame):
+        entries = self.entries
+        entries[key] = frame
+        entries.move_to_end(key)
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def invalidate(self, address=None):
+        if address is None:
+            self.entries.clear()
+            return
+        for key in [key for key in self.entries if key[1] == address]:
+            del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class PendingRead:
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class ReadCache:
+    # Master-side cache of read responses keyed by (address, command, request
+    # payload). Each entry carries its own expiry. Callers that miss while the
+    # same key is already being fetched wait for that transaction instead of
+    # putting a second one on the bus.
+    def __init__(self, ttl=1.0, command_ttls=None, maxsize=1024):
+        self.ttl = ttl
+        self.command_ttls = dict(command_ttls or {})
+        self.maxsize = maxsize
+        self.entries = {}
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def ttl_for(self, key):
+        return self.command_ttls.get(key[1], self.ttl)
+
+    def get(self, key):
+        with self.lock:
+            return self.lookup(key, time.monotonic())
+
+    def lookup(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, response = entry
+        if expires <= now:
+            del self.entries[key]
+            return None
+        self.hits += 1
+        return response
+
+    def put(self, key, response, ttl=None):
+        if ttl is None:
+            ttl = self.ttl_for(key)
+        if ttl <= 0:
+            return
+        with self.lock:
+            self.store(key, response, time.monotonic() + ttl)
+
+    def store(self, key, response, expires):
+        entries = self.entries
+        entries.pop(key, None)
+        entries[key] = (expires, response)
+        if len(entries) > self.maxsize:
+            del entries[next(iter(entries))]
+
+    def invalidate(self, address=None):
+        with self.lock:
+            if address is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if key[0] == address]:
+                del self.entries[key]
+
+    def get_or_fetch(self, key, fetch):
+        with self.lock:
+            response = self.lookup(key, time.monotonic())
+            if response is not None:
+                return response
+            pending = self.in_flight.get(key)
+            owner = pending is None
+            if owner:
+                pending = PendingRead()
+                self.in_flight[key] = pending
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            pending.event.wait()
+            return pending.result
+
+        response = None
+        try:
+            response = fetch()
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                if response is not None:
+                    ttl = self.ttl_for(key)
+                    if ttl > 0:
+                        self.store(key, response, time.monotonic() + ttl)
+            pending.result = response
+            pending.event.set()
+        return response
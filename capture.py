@@ -0,0 +1,167 @@
+import argparse
+import mmap
+import struct
+import threading
+import time
+from framing import ASCII_MODE, RTU_MODE
+from tracing import SENT, RECEIVED
+
+# File layout: MAGIC, then records of RECORD followed by the frame bytes.
+# Port names are written once, as a record with the NAME direction whose
+# payload is the name, and later records refer to them by number.
+MAGIC = b'MBCAP\x00\x01\x00'
+RECORD = struct.Struct('<dIHBB')
+
+DIRECTIONS = {SENT: 0, RECEIVED: 1}
+DIRECTION_NAMES = {code: name for name, code in DIRECTIONS.items()}
+NAME = 0xFF
+MODES = {ASCII_MODE: 0, RTU_MODE: 1}
+MODE_NAMES = {code: name for name, code in MODES.items()}
+
+
+def port_label(port):
+    # serial.Serial knows its device name; in-memory transports do not.
+    return getattr(port, 'port', None) or f'{type(port).__name__}-{id(port):x}'
+
+
+class CaptureWriter:
+    # Appends frames from any number of masters and slaves to one file. A
+    # record is packed and written in a single call under the lock, so
+    # threads never interleave partial records.
+    def __init__(self, path, buffering=1 << 16):
+        self.file = open(path, 'ab', buffering=buffering)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.lock = threading.Lock()
+        self.ports = {}
+        self.frames = 0
+
+    def port_id(self, name):
+        port = self.ports.get(name)
+        if port is None:
+            port = self.ports[name] = len(self.ports)
+            encoded = name.encode()
+            self.file.write(RECORD.pack(time.time(), len(encoded), port, NAME, 0) + encoded)
+        return port
+
+    def write(self, port_name, direction, mode, frame):
+        with self.lock:
+            port = self.port_id(port_name)
+            self.file.write(RECORD.pack(time.time(), len(frame), port,
+                                        DIRECTIONS[direction], MODES[mode]) + frame)
+            self.frames += 1
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CaptureRecord:
+    __slots__ = ('timestamp', 'port', 'direction', 'mode', 'frame')
+
+    def __init__(self, timestamp, port, direction, mode, frame):
+        self.timestamp = timestamp
+        self.port = port
+        self.direction = direction
+        self.mode = mode
+        self.frame = frame
+
+
+class CaptureReader:
+    # Maps the capture read-only and hands out frames as memoryview slices of
+    # the mapping, so iterating a multi-GB capture copies nothing. Views must
+    # be released (or dropped) before close().
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if self.view[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"Not a frame capture: {path}")
+
+    def __iter__(self):
+        view = self.view
+        end = len(view)
+        offset = len(MAGIC)
+        ports = {}
+        unpack_from = RECORD.unpack_from
+        size = RECORD.size
+        while offset + size <= end:
+            timestamp, length, port, direction, mode = unpack_from(view, offset)
+            offset += size
+            if offset + length > end:
+                # A capture cut off mid-record, e.g. by a crash.
+                break
+            frame = view[offset:offset + length]
+            offset += length
+            if direction == NAME:
+                ports[port] = bytes(frame).decode()
+                continue
+            yield CaptureRecord(timestamp, ports.get(port, str(port)),
+                                DIRECTION_NAMES[direction], MODE_NAMES[mode], frame)
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def replay(records, target, speed=None, direction=RECEIVED, port=None):
+    # Feeds captured frames to a slave's handle_*_frame or a master's
+    # validate_*_frame. speed=None replays as fast as possible, 1.0 at the
+    # captured pace, 2.0 twice as fast. Returns the number of frames fed.
+    if hasattr(target, 'handle_rtu_frame'):
+        handlers = {ASCII_MODE: target.handle_ascii_frame, RTU_MODE: target.handle_rtu_frame}
+    else:
+        handlers = {ASCII_MODE: target.validate_ascii_frame, RTU_MODE: target.validate_rtu_frame}
+    count = 0
+    first = None
+    started = time.monotonic()
+    for record in records:
+        if record.direction != direction or (port is not None and record.port != port):
+            continue
+        if speed:
+            if first is None:
+                first = record.timestamp
+            delay = (record.timestamp - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        handlers[record.mode](bytes(record.frame))
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the frames in a capture file")
+    parser.add_argument('path')
+    parser.add_argument('--port', help="only frames from this port")
+    parser.add_argument('--limit', type=int, default=0, help="stop after this many frames")
+    args = parser.parse_args()
+
+    with CaptureReader(args.path) as reader:
+        shown = 0
+        for record in reader:
+            if args.port is not None and record.port != args.port:
+                continue
+            print(f"{record.timestamp:.6f} {record.port} {record.direction} {record.mode} "
+                  f"{bytes(record.frame)}")
+            del record
+            shown += 1
+            if shown == args.limit:
+                break
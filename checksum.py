@@ -0,0 +1,114 @@
+import binascii
+import sys
+from array import array
+
+
+def _build_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if (crc & 1) != 0:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+CRC_TABLE = _build_crc_table()
+
+# The CRC register is 16 bits wide, so after two bytes it depends only on
+# (crc ^ word). Stepping a word at a time halves the Python-level loop for
+# anything longer than a short request.
+def _build_crc_word_table():
+    table = array('H', bytes(2 * 65536))
+    for word in range(65536):
+        crc = (word >> 8) ^ CRC_TABLE[word & 0xFF]
+        table[word] = (crc >> 8) ^ CRC_TABLE[crc & 0xFF]
+    return table
+
+CRC_WORD_TABLE = _build_crc_word_table()
+WORD_THRESHOLD = 16
+
+
+class Crc16:
+    def __init__(self, data=b''):
+        self.crc = 0xFFFF
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        self.crc = crc_value(data, self.crc)
+        return self
+
+    def reset(self):
+        self.crc = 0xFFFF
+
+    def value(self):
+        return self.crc
+
+    def digest(self):
+        return self.crc.to_bytes(2, byteorder='little')
+
+
+class Lrc:
+    def __init__(self, data=b''):
+        self.total = 0
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        self.total += sum(data)
+        return self
+
+    def reset(self):
+        self.total = 0
+
+    def value(self):
+        return -self.total & 0xFF
+
+
+def calculate_lrc(data):
+    return -sum(data) & 0xFF
+
+def calculate_crc(data):
+    return crc_value(data).to_bytes(2, byteorder='little')
+
+def crc_value(data, crc=0xFFFF):
+    size = len(data)
+    if size >= WORD_THRESHOLD:
+        words = array('H')
+        words.frombytes(data[:size & ~1])
+        if sys.byteorder == 'big':
+            words.byteswap()
+        table = CRC_WORD_TABLE
+        for word in words:
+            crc = table[crc ^ word]
+        if size & 1:
+            crc = (crc >> 8) ^ CRC_TABLE[(crc ^ data[-1]) & 0xFF]
+        return crc
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+# A frame followed by its own little-endian CRC always checksums to zero,
+# and the bytes of a frame plus its LRC always sum to zero mod 256, so whole
+# frames can be checked without splitting off the checksum first.
+def check_rtu_frame(frame):
+    return len(frame) >= 3 and crc_value(frame) == 0
+
+def check_ascii_frame(frame):
+    if len(frame) < 5 or frame[:1] != b':' or frame[-2:] != b'\r\n':
+        return False
+    try:
+        binary_data = binascii.unhexlify(frame[1:-2])
+    except (binascii.Error, ValueError):
+        return False
+    return sum(binary_data) & 0xFF == 0
+
+def check_rtu_frames(frames):
+    return [len(frame) >= 3 and crc_value(frame) == 0 for frame in frames]
+
+def check_ascii_frames(frames):
+    return [check_ascii_frame(frame) for frame in frames]
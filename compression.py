@@ -0,0 +1,62 @@
+import zlib
+
+# User-defined function codes for compressed text. COMPRESSION carries the
+# preset dictionaries the master knows and the slave answers with the one it
+# shares, or NONE; the compressed variants of commands 1 and 2 are only used
+# with slaves that answered. Compressed payloads are [format][data], with
+# data a raw deflate stream against PRESET_DICTIONARY when format is DEFLATE.
+COMPRESSION = 71
+WRITE_TEXT_COMPRESSED = 72
+READ_TEXT_COMPRESSED = 73
+
+NONE = 0
+DICTIONARY_ID = 1
+OFFER = bytes((DICTIONARY_ID,))
+
+RAW = 0
+DEFLATE = 1
+
+# Below this the deflate block overhead eats most of the gain.
+MIN_COMPRESS = 24
+MAX_TEXT = 1 << 16
+
+# Seeds the deflate window so even a short payload finds matches. Strings
+# used most often go last, where matches are cheapest. Any change needs a
+# new DICTIONARY_ID, or peers with the old one decode garbage.
+PRESET_DICTIONARY = (
+    b"version=serial=firmware=description=location=unit=scale=offset=min=max="
+    b"interval=retries=timeout=enabled=false\nenabled=true\nname=\n"
+    b"stopbits=1\nparity=N\nparity=E\nbytesize=8\nbaudrate=9600\nbaudrate=19200\n"
+    b"baudrate=115200\nmode=ASCII\nmode=RTU\naddress=register=value=status=OK\n"
+    b"Sample text from slave"
+)
+
+
+def select_dictionary(offered):
+    return bytes((DICTIONARY_ID if DICTIONARY_ID in offered else NONE,))
+
+def compress(text):
+    # Stays RAW when deflate would not make the payload shorter.
+    if len(text) >= MIN_COMPRESS:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY,
+                                      PRESET_DICTIONARY)
+        packed = compressor.compress(text) + compressor.flush()
+        if len(packed) < len(text):
+            return bytes((DEFLATE,)) + packed
+    return bytes((RAW,)) + bytes(text)
+
+def decompress(payload):
+    if not payload:
+        raise ValueError("Empty compressed payload")
+    if payload[0] == RAW:
+        return bytes(payload[1:])
+    if payload[0] != DEFLATE:
+        raise ValueError(f"Unknown payload format: {payload[0]}")
+    decompressor = zlib.decompressobj(-15, zdict=PRESET_DICTIONARY)
+    try:
+        text = decompressor.decompress(bytes(payload[1:]), MAX_TEXT)
+    except zlib.error as e:
+        raise ValueError(f"Bad compressed payload: {e}") from None
+    if not decompressor.eof:
+        raise ValueError("Compressed payload truncated or too large")
+    return text
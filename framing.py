@@ -0,0 +1,298 @@
+import binascii
+from collections import deque
+from checksum import CRC_TABLE, crc_value
+
+ASCII_MODE = 'ASCII'
+RTU_MODE = 'RTU'
+
+HEX_PAIRS = tuple(b'%02X' % value for value in range(256))
+
+# Longest RTU frame: address, function, 252 data bytes and the CRC.
+MAX_RTU_FRAME = 256
+MIN_RTU_FRAME = 4
+MAX_ADDRESS = 247
+# Bytes held back while no frame can be confirmed, e.g. when frames without
+# a known length arrive glued together.
+MAX_RTU_BACKLOG = 8 * MAX_RTU_FRAME
+
+# Frame lengths that follow from the function code alone, the frames the
+# decoder trusts first when it has to find one inside noise. Requests of 15
+# and 16 and replies to 3 and 4 carry a byte count at the given offset; the
+# frame is that many bytes plus the fixed part.
+FIXED_REQUESTS = {3: 8, 4: 8, 6: 8}
+COUNTED_REQUESTS = {15: (6, 9), 16: (6, 9)}
+FIXED_REPLIES = {6: 8, 15: 8, 16: 8}
+COUNTED_REPLIES = {3: (2, 5), 4: (2, 5)}
+EXCEPTION_REPLY = 5
+
+
+def frame_size(mode, data):
+    if mode == ASCII_MODE:
+        return 9 + 2 * len(data)
+    return 4 + len(data)
+
+def max_frame_size(mode):
+    if mode == ASCII_MODE:
+        return 9 + 2 * (MAX_RTU_FRAME - 4)
+    return MAX_RTU_FRAME
+
+def write_ascii_frame(buffer, offset, slave_address, command, data):
+    end = offset + 5 + 2 * len(data)
+    buffer[offset:offset + 5] = b':' + HEX_PAIRS[slave_address] + HEX_PAIRS[command]
+    buffer[offset + 5:end] = binascii.hexlify(data)
+    buffer[end:end + 4] = HEX_PAIRS[-(slave_address + command + sum(data)) & 0xFF] + b'\r\n'
+    return end + 4
+
+def write_rtu_frame(buffer, offset, slave_address, command, data):
+    end = offset + 2 + len(data)
+    buffer[offset] = slave_address
+    buffer[offset + 1] = command
+    buffer[offset + 2:end] = data
+    crc = (0xFFFF >> 8) ^ CRC_TABLE[(0xFFFF ^ slave_address) & 0xFF]
+    crc = (crc >> 8) ^ CRC_TABLE[(crc ^ command) & 0xFF]
+    crc = crc_value(data, crc)
+    buffer[end] = crc & 0xFF
+    buffer[end + 1] = crc >> 8
+    return end + 2
+
+
+class FrameEncoder:
+    def __init__(self, size=520):
+        self.buffer = bytearray(size)
+
+    def reserve(self, size):
+        # Views handed out earlier keep pointing at the old buffer, so grow by
+        # replacing it rather than resizing in place.
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+        return self.buffer
+
+    def encode(self, mode, slave_address, command, data):
+        buffer = self.reserve(frame_size(mode, data))
+        if mode == ASCII_MODE:
+            end = write_ascii_frame(buffer, 0, slave_address, command, data)
+        else:
+            end = write_rtu_frame(buffer, 0, slave_address, command, data)
+        return memoryview(buffer)[:end]
+
+    def encode_batch(self, mode, frames):
+        buffer = self.reserve(sum(frame_size(mode, data) for _, _, data in frames))
+        write_frame = write_ascii_frame if mode == ASCII_MODE else write_rtu_frame
+        bounds = []
+        offset = 0
+        for slave_address, command, data in frames:
+            end = write_frame(buffer, offset, slave_address, command, data)
+            bounds.append((offset, end))
+            offset = end
+        return memoryview(buffer)[:offset], bounds
+
+
+def rtu_frame_length(buffer, start, replies):
+    # None when the function's frames have no length known up front, or the
+    # byte count has not arrived yet.
+    function = buffer[start + 1]
+    if replies:
+        if function & 0x80:
+            return EXCEPTION_REPLY
+        fixed, counted = FIXED_REPLIES, COUNTED_REPLIES
+    else:
+        fixed, counted = FIXED_REQUESTS, COUNTED_REQUESTS
+    if function in fixed:
+        return fixed[function]
+    if function in counted:
+        offset, overhead = counted[function]
+        if start + offset < len(buffer):
+            return overhead + buffer[start + offset]
+    return None
+
+def rtu_frame_end(buffer, start, replies):
+    # End of the frame at start if its length follows from its function
+    # code and its CRC checks, else None.
+    if start + MIN_RTU_FRAME > len(buffer) or buffer[start] > MAX_ADDRESS:
+        return None
+    length = rtu_frame_length(buffer, start, replies)
+    if length is None or start + length > len(buffer):
+        return None
+    if crc_value(buffer[start:start + length]) != 0:
+        return None
+    return start + length
+
+
+class FrameDecoder:
+    # Splits received bytes into frames. When line noise corrupts a frame,
+    # the decoder skips to the next plausible frame start instead of waiting
+    # for the line to go quiet again: for ASCII the last ':' before a line
+    # end, for RTU the next frame whose length and CRC check, or whose CRC
+    # checks up to such a frame or the end of the block (see split_rtu and
+    # recover). RTU lengths differ between requests and replies, so a
+    # master's decoder is created with replies=True. Bytes skipped that way
+    # are counted, and passed to on_discard if set.
+    def __init__(self, mode, replies=False):
+        self.mode = mode
+        self.replies = replies
+        self.buffer = bytearray()
+        self.frames = deque()
+        self.discarded_bytes = 0
+        self.resyncs = 0
+        self.on_discard = None
+
+    def feed(self, data):
+        self.buffer += data
+        if self.mode == ASCII_MODE:
+            self.split_ascii()
+        elif len(self.buffer) > MAX_RTU_BACKLOG + MAX_RTU_FRAME:
+            # Too long for one frame, so there was noise instead of silence
+            # between frames; recover the complete ones now. Waiting for a
+            # frame's worth past the backlog keeps a babbling line from being
+            # rescanned on every read.
+            self.split_rtu(False)
+        return len(self.frames)
+
+    def split_ascii(self):
+        buffer = self.buffer
+        start = 0
+        while True:
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            # ':' never occurs inside a frame, so anything before the last
+            # one is the remains of an earlier, broken frame.
+            colon = buffer.rfind(b':', start, end)
+            if colon > start:
+                self.discard(colon - start)
+                start = colon
+            self.frames.append(bytes(buffer[start:end + 1]))
+            start = end + 1
+        if start:
+            del buffer[:start]
+
+    def split_rtu(self, final):
+        buffer = self.buffer
+        frames = self.frames
+        if final and len(buffer) >= MIN_RTU_FRAME and crc_value(buffer) == 0:
+            frames.append(bytes(buffer))
+            buffer.clear()
+            return
+        replies = self.replies
+        found = len(frames)
+        start = 0
+        position = 0
+        pending = None
+        last = len(buffer) - MIN_RTU_FRAME
+        while position <= last:
+            # Any one position passes a CRC by chance now and then, so a
+            # frame only counts if it also has the length its function code
+            # implies and ends where the block or another such frame does.
+            end = rtu_frame_end(buffer, position, replies)
+            if end is not None and end < len(buffer) and rtu_frame_end(buffer, end, replies) is None:
+                if not final and end + MAX_RTU_FRAME > len(buffer):
+                    # The next frame may still be arriving; check this one
+                    # again on a later pass.
+                    pending = position
+                    break
+                end = None
+            if end is None:
+                position += 1
+                continue
+            if position > start and not self.recover(start, position):
+                self.discard(position - start)
+            frames.append(bytes(buffer[position:end]))
+            start = position = end
+        if final:
+            if start < len(buffer) and not self.recover(start, len(buffer)):
+                if len(frames) == found:
+                    # Nothing to recover: pass it on whole for the receiver
+                    # to count as a bad frame.
+                    frames.append(bytes(buffer))
+                else:
+                    self.discard(len(buffer) - start)
+            buffer.clear()
+            return
+        # Keep what could still be part of a frame: one in progress, one
+        # waiting for its successor, or ones only recover can find later.
+        keep = max(start, len(buffer) - MAX_RTU_BACKLOG)
+        if pending is not None:
+            keep = min(keep, pending)
+        if keep > start:
+            self.discard(keep - start)
+        del buffer[:keep]
+
+    def recover(self, start, end):
+        # Text and the user-defined commands have no length known up front.
+        # Such a frame is trusted when its CRC checks over exactly the bytes
+        # up to a trusted frame or the end of the block; working back from
+        # there also finds several of them glued together. Only one CRC per
+        # start is tried, so noise rarely passes.
+        buffer = self.buffer
+        found = []
+        while end - start >= MIN_RTU_FRAME:
+            for position in range(max(start, end - MAX_RTU_FRAME), end - MIN_RTU_FRAME + 1):
+                if (buffer[position] <= MAX_ADDRESS and buffer[position + 1] & 0x7F
+                        and crc_value(buffer[position:end]) == 0):
+                    break
+            else:
+                break
+            found.append(bytes(buffer[position:end]))
+            end = position
+        if not found:
+            return False
+        if end > start:
+            self.discard(end - start)
+        self.frames.extend(reversed(found))
+        return True
+
+    def discard(self, count):
+        self.discarded_bytes += count
+        self.resyncs += 1
+        if self.on_discard is not None:
+            self.on_discard(count)
+
+    # Called when the line has been silent for longer than the character
+    # timeout: that ends an RTU frame, and abandons a partial ASCII one.
+    def flush(self):
+        if self.buffer:
+            if self.mode == ASCII_MODE:
+                self.frames.append(bytes(self.buffer))
+                self.buffer.clear()
+            else:
+                self.split_rtu(True)
+        return len(self.frames)
+
+    def next_frame(self):
+        if self.frames:
+            return self.frames.popleft()
+        return b''
+
+    def reset(self):
+        self.buffer.clear()
+        self.frames.clear()
+
+
+class FrameReader:
+    def __init__(self, port, mode, replies=False):
+        self.port = port
+        self.decoder = FrameDecoder(mode, replies)
+        self.port_timeout = None
+        self.timeout_set = False
+
+    def set_timeout(self, timeout):
+        # pyserial reconfigures the port on every assignment, so only touch it
+        # when the value actually changes.
+        if not self.timeout_set or timeout != self.port_timeout:
+            self.port.timeout = timeout
+            self.port_timeout = timeout
+            self.timeout_set = True
+
+    def read_frame(self, timeout, character_timeout):
+        decoder = self.decoder
+        if decoder.frames:
+            return decoder.next_frame()
+        self.set_timeout(timeout)
+        while True:
+            chunk = self.port.read(self.port.in_waiting or 1)
+            if not chunk:
+                decoder.flush()
+                return decoder.next_frame()
+            if decoder.feed(chunk):
+                return decoder.next_frame()
+            self.set_timeout(character_timeout)
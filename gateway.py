@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import struct
+from collections import OrderedDict, deque
+from async_master import AsyncModbusMaster
+from master import ASCII_MODE, RTU_MODE
+from metrics import serve_metrics
+from tracing import Tracer
+from link import LINK_SETTINGS
+from batch import BATCH
+from transfer import CHUNK_BEGIN, CHUNK_DATA, CHUNK_STATUS, CHUNK_READ
+from registers import ILLEGAL_FUNCTION
+
+MBAP_HEADER = struct.Struct('>HHHB')
+
+# Modbus exception codes a gateway answers with on behalf of the serial side.
+SERVER_BUSY = 0x06
+PATH_UNAVAILABLE = 0x0A
+TARGET_FAILED = 0x0B
+
+# User-defined commands a TCP client may not send. New line settings would
+# leave the gateway's master behind, a batch can carry them or address
+# units on other lines, and chunked transfers span several frames, some of
+# them unanswered.
+LINE_COMMANDS = {LINK_SETTINGS, BATCH, CHUNK_BEGIN, CHUNK_DATA, CHUNK_STATUS, CHUNK_READ}
+
+
+class SerialLine:
+    # One serial port and the requests waiting for it. Each TCP client has its
+    # own queue and the line takes one request from each client in turn, so a
+    # client that pipelines hundreds of requests cannot starve the others.
+    def __init__(self, master):
+        self.master = master
+        self.clients = OrderedDict()
+        self.ready = asyncio.Event()
+        self.worker = None
+        self.transactions = 0
+        self.failures = 0
+
+    def start(self):
+        if self.worker is None:
+            self.master.start()
+            self.worker = asyncio.get_running_loop().create_task(self.run())
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+        await self.master.close()
+
+    def queued(self, client):
+        queue = self.clients.get(client)
+        return len(queue) if queue is not None else 0
+
+    def put(self, client, request):
+        queue = self.clients.get(client)
+        if queue is None:
+            queue = self.clients[client] = deque()
+        queue.append(request)
+        self.ready.set()
+
+    def drop(self, client):
+        self.clients.pop(client, None)
+
+    def next_request(self):
+        client, queue = next(iter(self.clients.items()))
+        request = queue.popleft()
+        if queue:
+            self.clients.move_to_end(client)
+        else:
+            del self.clients[client]
+        return client, request
+
+    async def run(self):
+        while True:
+            if not self.clients:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            client, (transaction_id, unit, command, data) = self.next_request()
+            self.transactions += 1
+            try:
+                reply = await self.master.request_pdu(unit, command, data)
+            except Exception as e:
+                self.master.tracer.error("Gateway request to unit %d failed: %s", unit, e)
+                reply = None
+            if unit == 0:
+                continue
+            if reply is None:
+                self.failures += 1
+                client.send_exception(transaction_id, unit, command, TARGET_FAILED)
+            else:
+                # The serial reply's own function code, so exception replies
+                # reach the client as exceptions.
+                function, response = reply
+                client.send(transaction_id, unit, bytes([function]) + response)
+
+
+class GatewayClient:
+    def __init__(self, gateway, writer):
+        self.gateway = gateway
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername')
+        self.closed = False
+
+    def send(self, transaction_id, unit, pdu):
+        if self.closed:
+            return
+        self.writer.write(MBAP_HEADER.pack(transaction_id, 0, len(pdu) + 1, unit) + pdu)
+
+    def send_exception(self, transaction_id, unit, command, code):
+        self.send(transaction_id, unit, bytes([command | 0x80, code]))
+
+
+class ModbusGateway:
+    # Modbus TCP in front of one or more serial lines. routes maps unit
+    # identifiers to lines; units without a route go to default_line, or are
+    # refused with "gateway path unavailable" if that is None.
+    def __init__(self, masters, routes=None, default_line=0, max_pending=64, tracer=None):
+        self.lines = [SerialLine(master) for master in masters]
+        self.routes = {unit: self.lines[index] for unit, index in (routes or {}).items()}
+        self.default_line = self.lines[default_line] if default_line is not None else None
+        self.max_pending = max_pending
+        self.tracer = tracer or Tracer()
+        self.clients = set()
+        self.server = None
+        self.rejected = 0
+
+    def route(self, unit):
+        return self.routes.get(unit, self.default_line)
+
+    async def start(self, host='0.0.0.0', port=502):
+        for line in self.lines:
+            line.start()
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for client in list(self.clients):
+            client.writer.close()
+        for line in self.lines:
+            await line.close()
+
+    async def serve_forever(self, host='0.0.0.0', port=502):
+        server = await self.start(host, port)
+        try:
+            await server.serve_forever()
+        finally:
+            await self.close()
+
+    async def handle_client(self, reader, writer):
+        client = GatewayClient(self, writer)
+        self.clients.add(client)
+        self.tracer.info("Gateway client connected: %s", client.peer)
+        try:
+            while True:
+                header = await reader.readexactly(MBAP_HEADER.size)
+                transaction_id, protocol, length, unit = MBAP_HEADER.unpack(header)
+                if protocol != 0 or not 2 <= length <= 254:
+                    self.tracer.warning("Gateway dropping client %s: bad MBAP header %s",
+                                        client.peer, header)
+                    break
+                pdu = await reader.readexactly(length - 1)
+                self.handle_request(client, transaction_id, unit, pdu[0], pdu[1:])
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            client.closed = True
+            self.clients.discard(client)
+            for line in self.lines:
+                line.drop(client)
+            writer.close()
+            self.tracer.info("Gateway client disconnected: %s", client.peer)
+
+    def handle_request(self, client, transaction_id, unit, command, data):
+        if command in LINE_COMMANDS:
+            if unit != 0:
+                client.send_exception(transaction_id, unit, command, ILLEGAL_FUNCTION)
+            return
+        if unit == 0:
+            # A broadcast goes out on every line and is never answered.
+            for line in self.lines:
+                line.put(client, (transaction_id, unit, command, data))
+            return
+        line = self.route(unit)
+        if line is None:
+            client.send_exception(transaction_id, unit, command, PATH_UNAVAILABLE)
+            return
+        if line.queued(client) >= self.max_pending:
+            self.rejected += 1
+            client.send_exception(transaction_id, unit, command, SERVER_BUSY)
+            return
+        line.put(client, (transaction_id, unit, command, data))
+
+
+def parse_route(text):
+    unit, index = text.split(':')
+    return int(unit), int(index)
+
+async def main(args):
+    masters = []
+    for name in args.serial:
+        master = AsyncModbusMaster(name, args.mode, tracer=Tracer(args.level))
+        master.set_parameters(baudrate=args.baudrate, bytesize=8, parity='N', stopbits=1)
+        masters.append(master)
+    gateway = ModbusGateway(masters, dict(args.route), tracer=Tracer(args.level))
+    if args.metrics_port:
+        serve_metrics([master.metrics for master in masters], args.metrics_port)
+    await gateway.serve_forever(args.host, args.port)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modbus TCP to serial gateway")
+    parser.add_argument('serial', nargs='+', help="serial ports, one per line")
+    parser.add_argument('--mode', choices=[ASCII_MODE, RTU_MODE], default=RTU_MODE)
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=502)
+    parser.add_argument('--route', type=parse_route, action='append', default=[],
+                        metavar='UNIT:LINE', help="send a unit to the given serial port index")
+    parser.add_argument('--level', type=int, default=30)
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help="serve Prometheus metrics on this local port")
+    args = parser.parse_args()
+    asyncio.run(main(args))
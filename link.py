@@ -0,0 +1,29 @@
+import struct
+from framing import ASCII_MODE, RTU_MODE
+
+# User-defined function code for line settings. With a payload it proposes
+# new settings; with none it asks for the current ones, which doubles as
+# the verification ping after a switch.
+LINK_SETTINGS = 69
+
+PROPOSAL = struct.Struct('>IBH')
+SETTINGS = struct.Struct('>IB')
+
+ACCEPT = b'\x01'
+REJECT = b'\x00'
+
+MODES = {ASCII_MODE: 0, RTU_MODE: 1}
+MODE_NAMES = {code: name for name, code in MODES.items()}
+
+STANDARD_BAUDRATES = (9600, 19200, 38400, 57600, 115200)
+
+
+def encode_proposal(baudrate, mode, verify_timeout):
+    return PROPOSAL.pack(baudrate, MODES[mode], int(verify_timeout * 1000))
+
+def decode_proposal(data):
+    baudrate, mode, verify_ms = PROPOSAL.unpack(data)
+    return baudrate, MODE_NAMES.get(mode), verify_ms / 1000
+
+def encode_settings(baudrate, mode):
+    return SETTINGS.pack(baudrate, MODES[mode])
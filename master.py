@@ -1,8 +1,24 @@
-import serial
 import time
 import binascii
-import tkinter as tk
-from tkinter import ttk, messagebox
+import itertools
+import queue
+import threading
+from checksum import calculate_lrc, calculate_crc
+from framing import FrameReader, FrameEncoder, frame_size, max_frame_size
+from transport import open_transport
+from tracing import Tracer, DEBUG, SENT, RECEIVED
+from metrics import Metrics
+from capture import port_label
+from link import LINK_SETTINGS, ACCEPT, encode_proposal, encode_settings
+from batch import BATCH, encode_commands, pack_entries, decode_results
+from compression import (COMPRESSION, WRITE_TEXT_COMPRESSED, READ_TEXT_COMPRESSED, OFFER,
+                         DEFLATE, compress, decompress)
+from registers import (READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS, WRITE_SINGLE_REGISTER,
+                       WRITE_MULTIPLE_COILS, WRITE_MULTIPLE_REGISTERS, RANGE,
+                       encode_read, encode_write_registers, encode_write_coils,
+                       decode_registers, write_acknowledged)
+from timing import (character_time, rtu_gaps, backoff_delay, RoundTripEstimator,
+                    ASCII_CHARACTER_TIMEOUT, GAP_MARGIN_CHARACTERS, GAP_MARGIN_ALLOWANCE)
 
 ASCII_MODE = 'ASCII'
 RTU_MODE = 'RTU'
@@ -10,25 +26,6 @@ RTU_MODE = 'RTU'
 MASTER = 'Master'
 SLAVE = 'Slave'
 
-def calculate_lrc(data):
-    lrc = 0
-    for byte in data:
-        lrc += byte
-    lrc = ((lrc ^ 0xFF) + 1) & 0xFF
-    return lrc
-
-def calculate_crc(data):
-    crc = 0xFFFF
-    for pos in data:
-        crc ^= pos
-        for _ in range(8):
-            if (crc & 1) != 0:
-                crc >>= 1
-                crc ^= 0xA001
-            else:
-                crc >>= 1
-    return crc.to_bytes(2, byteorder='little')
-
 def ascii_to_rtu(frame):
     return binascii.unhexlify(frame)
 
@@ -36,124 +33,561 @@ def rtu_to_ascii(frame):
     return binascii.hexlify(frame).upper()
 
 class ModbusMaster:
-    def __init__(self, port, mode=ASCII_MODE):
-        self.port = serial.Serial(port)
+    def __init__(self, port, mode=ASCII_MODE, tracer=None, read_cache=None, metrics=None):
+        self.port = open_transport(port)
         self.mode = mode
         self.timeout = 1.0
         self.retransmissions = 3
         self.transaction_timeout = 5.0
-        self.character_timeout = 0.01
+        self.minimum_response_timeout = 0.05
+        self.retry_backoff = 0.02
+        self.retry_backoff_cap = 1.0
+        self.response = None
+        self.failure = None
+        # (address, function) of the request awaiting a reply and of the
+        # last valid reply received.
+        self.expected = None
+        self.reply_header = None
+        self.tracer = tracer or Tracer()
+        self.metrics = metrics or Metrics('modbus_master')
+        self.capture = None
+        self.reader = FrameReader(self.port, mode, replies=True)
+        self.reader.decoder.on_discard = self.count_discarded
+        self.encoder = FrameEncoder()
+        self.lock = threading.RLock()
+        self.read_cache = read_cache
+        self.read_commands = {2, READ_TEXT_COMPRESSED}
+        # Commands the slave never answers.
+        self.unanswered_commands = {1, WRITE_TEXT_COMPRESSED}
+        self.compression = {}
+        self.round_trips = {}
+        self.line_round_trip = RoundTripEstimator(None)
+        self.line_idle_at = 0.0
+        self.update_timing()
 
     def set_parameters(self, baudrate, bytesize, parity, stopbits):
         self.port.baudrate = baudrate
         self.port.bytesize = bytesize
         self.port.parity = parity
         self.port.stopbits = stopbits
+        self.update_timing()
 
-    def send_frame(self, slave_address, command, data):
+    def update_timing(self):
+        port = self.port
+        settings = (port.baudrate, port.bytesize, port.parity, port.stopbits)
+        self.char_time = character_time(*settings)
+        self.t15, self.t35 = rtu_gaps(*settings)
+        self.max_frame_time = max_frame_size(self.mode) * self.char_time
         if self.mode == ASCII_MODE:
-            frame = self.prepare_ascii_frame(slave_address, command, data)
+            self.character_timeout = ASCII_CHARACTER_TIMEOUT
         else:
-            frame = self.prepare_rtu_frame(slave_address, command, data)
-        
-        retries = 0
-        while retries <= self.retransmissions:
-            print(f"Master sending frame: {frame}")
-            self.port.write(frame)
+            self.character_timeout = self.t35
 
-            if slave_address == 0 or command == 1:
-                print("=================Master complete=================")
-                return True
-            
-            print("===============Master Awaiting RES===============")
-            if self.receive_response():
-                print("=================Master complete=================")
+    def start_capture(self, writer, port_name=None):
+        self.capture = writer
+        self.capture_port = port_name or port_label(self.port)
+
+    def stop_capture(self):
+        self.capture = None
+
+    def record_frame(self, direction, frame):
+        self.tracer.frame(direction, frame)
+        if self.capture is not None and frame:
+            self.capture.write(self.capture_port, direction, self.mode, frame)
+
+    def count_discarded(self, count):
+        self.metrics.inc('resyncs')
+        self.metrics.inc('discarded_bytes', count)
+
+    def set_mode(self, mode):
+        self.mode = mode
+        self.reader.decoder.mode = mode
+        self.reader.decoder.reset()
+        self.update_timing()
+
+    def apply_link(self, baudrate, mode):
+        port = self.port
+        self.set_parameters(baudrate, port.bytesize, port.parity, port.stopbits)
+        self.set_mode(mode)
+        # Round trips measured under the old settings no longer apply.
+        self.round_trips.clear()
+        self.line_round_trip = RoundTripEstimator(None)
+
+    # Moves every slave on the line, then the master, to new settings. Each
+    # slave answers the proposal under the old settings and switches; the
+    # master follows and pings them all. A slave that hears nothing within
+    # verify_timeout returns to the old settings on its own, so on failure
+    # the master only has to bring the verified ones back and wait.
+    def upgrade_link(self, slave_addresses, baudrate, mode=RTU_MODE, verify_timeout=2.0):
+        with self.lock:
+            return self.run_steps(self.link_upgrade(slave_addresses, baudrate, mode, verify_timeout))
+
+    # Runs a generator that yields (address, command, data) requests, which
+    # get the reply sent back, or a number of seconds to wait. The async
+    # master runs the same generators on its worker and returns an awaitable.
+    def run_steps(self, steps):
+        reply = None
+        try:
+            while True:
+                step = steps.send(reply)
+                if isinstance(step, tuple):
+                    reply = self.request(*step)
+                else:
+                    time.sleep(step)
+                    reply = None
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            steps.close()
+
+    def link_upgrade(self, slave_addresses, baudrate, mode, verify_timeout):
+        tracer = self.tracer
+        old = (self.port.baudrate, self.mode)
+        proposal = encode_proposal(baudrate, mode, verify_timeout)
+        # A slave only notices its deadline once a frame, or line noise, has
+        # ended, which can take up to one character timeout more.
+        if mode == ASCII_MODE:
+            settle = verify_timeout + ASCII_CHARACTER_TIMEOUT
+        else:
+            port = self.port
+            settle = verify_timeout + rtu_gaps(baudrate, port.bytesize, port.parity, port.stopbits)[1]
+        for address in slave_addresses:
+            reply = yield (address, LINK_SETTINGS, proposal)
+            if reply != ACCEPT:
+                tracer.warning("Slave %d did not accept %s baud, %s", address, baudrate, mode)
+                yield settle
+                return False
+
+        # There are no round-trip estimates for the new settings yet, and an
+        # answer after the slaves' deadline is useless, so every attempt
+        # has to fit inside the verification window.
+        transaction_timeout = self.transaction_timeout
+        self.transaction_timeout = min(transaction_timeout,
+                                       verify_timeout / (self.retransmissions + 1))
+        try:
+            self.apply_link(baudrate, mode)
+            expected = encode_settings(baudrate, mode)
+            verified = []
+            for address in slave_addresses:
+                if (yield (address, LINK_SETTINGS, b'')) == expected:
+                    verified.append(address)
+            if len(verified) == len(slave_addresses):
+                tracer.info("Link upgraded to %s baud, %s", baudrate, mode)
                 return True
-            retries += 1
-            print("============FAILED TO OBTAIN RESPONSE============")
-            print(f"Retry: {retries}")
+
+            tracer.warning("Link verification failed, returning to %s baud, %s", *old)
+            revert = encode_proposal(old[0], old[1], verify_timeout)
+            for address in verified:
+                yield (address, LINK_SETTINGS, revert)
+            self.apply_link(*old)
+            for address in verified:
+                yield (address, LINK_SETTINGS, b'')
+        finally:
+            self.transaction_timeout = transaction_timeout
+        yield settle
         return False
 
+    def round_trip(self, slave_address):
+        estimator = self.round_trips.get(slave_address)
+        if estimator is None:
+            estimator = RoundTripEstimator(None, self.minimum_response_timeout)
+            self.round_trips[slave_address] = estimator
+        return estimator
+
+    # A slave that has never answered borrows the line-wide estimate, so an
+    # unknown or dead address does not cost the full transaction_timeout.
+    # transaction_timeout stays the upper bound for every attempt. The
+    # estimate is the slave's turnaround alone; the request's wire time and
+    # that of the longest reply are added on top, since a long reply after a
+    # run of short ones must not time out while it is still on the line.
+    def response_timeout(self, slave_address, wire_time):
+        line = self.line_round_trip
+        if line.srtt is None:
+            fallback = self.transaction_timeout
+        else:
+            fallback = max(self.minimum_response_timeout, line.timeout())
+        timeout = self.round_trip(slave_address).timeout(fallback)
+        return wire_time + self.max_frame_time + min(self.transaction_timeout, timeout)
+
+    def frame_time(self, data):
+        return frame_size(self.mode, data) * self.char_time
+
+    def record_round_trip(self, slave_address, sample):
+        self.round_trip(slave_address).observe(sample)
+        self.line_round_trip.observe(sample)
+
+    def record_timeout(self, slave_address):
+        self.round_trip(slave_address).timed_out()
+
+    def retry_delay(self, retries):
+        return backoff_delay(retries - 1, self.retry_backoff, self.retry_backoff_cap)
+
+    def idle_delay(self):
+        if self.mode == ASCII_MODE:
+            return 0.0
+        return self.line_idle_at + self.t35 - time.monotonic()
+
+    def send_frame(self, slave_address, command, data):
+        return self.request(slave_address, command, data) is not None
+
+    # Returns the response payload, b'' for frames that get no reply, or None
+    # when every retry failed.
+    def request(self, slave_address, command, data):
+        if self.read_cache is not None and slave_address != 0 and command in self.read_commands:
+            key = (slave_address, command, bytes(data))
+            response = self.read_cache.get_or_fetch(
+                key, lambda: self.transact(slave_address, command, data))
+            self.response = response
+            return response
+        return self.transact(slave_address, command, data)
+
+    # Like request, but returns (function, payload) with the function code
+    # of the reply, which has 0x80 set for an exception; None on failure.
+    def request_pdu(self, slave_address, command, data):
+        with self.lock:
+            response = self.transact(slave_address, command, data)
+            if response is None:
+                return None
+            return self.reply_function(command), response
+
+    def reply_function(self, command):
+        # Frames that get no reply are acknowledged as the command itself.
+        if self.reply_header is None:
+            return command
+        return self.reply_header[1]
+
+    def transact(self, slave_address, command, data):
+        with self.lock:
+            self.reply_header = None
+            frame = self.encoder.encode(self.mode, slave_address, command, data)
+
+            wire_time = len(frame) * self.char_time
+
+            tracer = self.tracer
+            metrics = self.metrics
+            retries = 0
+            while retries <= self.retransmissions:
+                if retries:
+                    time.sleep(self.retry_delay(retries))
+                delay = self.idle_delay()
+                if delay > 0:
+                    time.sleep(delay)
+                self.discard_input()
+                if tracer.debug_enabled:
+                    tracer.debug("Master sending frame: %s", bytes(frame))
+                self.record_frame(SENT, frame)
+                self.port.write(frame)
+                sent = time.monotonic()
+                self.line_idle_at = sent + wire_time
+                metrics.inc('frames_sent', slave=slave_address)
+                if retries:
+                    metrics.inc('retries', slave=slave_address)
+
+                if slave_address == 0 or command in self.unanswered_commands:
+                    tracer.debug("=================Master complete=================")
+                    return b''
+
+                tracer.debug("===============Master Awaiting RES===============")
+                self.response = None
+                self.expected = (slave_address, command)
+                if self.receive_response(self.response_timeout(slave_address, wire_time)):
+                    elapsed = time.monotonic() - sent
+                    metrics.observe('round_trip_seconds', elapsed, slave=slave_address)
+                    # Karn's rule: only unambiguous first attempts update the estimate.
+                    if retries == 0:
+                        self.record_round_trip(
+                            slave_address, elapsed - wire_time - self.frame_time(self.response))
+                    tracer.debug("=================Master complete=================")
+                    return self.response
+                metrics.inc(self.failure, slave=slave_address)
+                self.record_timeout(slave_address)
+                retries += 1
+                tracer.warning("============FAILED TO OBTAIN RESPONSE============")
+                tracer.warning("Retry: %d", retries)
+            return None
+
+    # Asks the slave whether it shares our preset dictionary; write_text and
+    # read_text compress for that slave from then on if it does.
+    def negotiate_compression(self, slave_address):
+        return self.compression_reply(slave_address, self.request(slave_address, COMPRESSION, OFFER))
+
+    def compression_reply(self, slave_address, reply):
+        enabled = reply == OFFER
+        self.compression[slave_address] = enabled
+        self.tracer.info("Slave %d compression: %s", slave_address, "on" if enabled else "off")
+        return enabled
+
+    def write_text(self, slave_address, text):
+        return self.send_frame(slave_address, *self.text_write(slave_address, text))
+
+    def text_write(self, slave_address, text):
+        # (command, payload) for the write, compressed if that pays off.
+        if self.compression.get(slave_address):
+            payload = compress(text)
+            if payload[0] == DEFLATE:
+                return WRITE_TEXT_COMPRESSED, payload
+        return 1, text
+
+    def read_text(self, slave_address):
+        command = self.text_read_command(slave_address)
+        return self.decode_text(slave_address, command, self.request(slave_address, command, b''))
+
+    def text_read_command(self, slave_address):
+        return READ_TEXT_COMPRESSED if self.compression.get(slave_address) else 2
+
+    def decode_text(self, slave_address, command, reply):
+        if reply is None or command != READ_TEXT_COMPRESSED:
+            return reply
+        try:
+            return decompress(reply)
+        except ValueError as e:
+            self.metrics.inc('bad_payloads', slave=slave_address, command=command)
+            self.presentExcpetion(str(e))
+            return None
+
+    # Register and coil access. Reads return an array of register values and
+    # writes return True, both None when the slave did not answer; an
+    # exception response raises ModbusError.
+    def read_holding_registers(self, slave_address, start, count):
+        reply = self.request(slave_address, READ_HOLDING_REGISTERS, encode_read(start, count))
+        return decode_registers(reply, count)
+
+    def read_input_registers(self, slave_address, start, count):
+        reply = self.request(slave_address, READ_INPUT_REGISTERS, encode_read(start, count))
+        return decode_registers(reply, count)
+
+    def write_register(self, slave_address, index, value):
+        reply = self.request(slave_address, WRITE_SINGLE_REGISTER, RANGE.pack(index, value))
+        return write_acknowledged(reply)
+
+    def write_registers(self, slave_address, start, values):
+        reply = self.request(slave_address, WRITE_MULTIPLE_REGISTERS,
+                             encode_write_registers(start, values))
+        return write_acknowledged(reply)
+
+    def write_coils(self, slave_address, start, values):
+        reply = self.request(slave_address, WRITE_MULTIPLE_COILS, encode_write_coils(start, values))
+        return write_acknowledged(reply)
+
+    # Runs several commands on one slave in a single transaction. Returns a
+    # (command, response) list in order, with None for commands that have
+    # no reply, or None if the slave did not answer.
+    def request_batch(self, slave_address, commands):
+        reply = self.request(slave_address, BATCH, encode_commands(slave_address, commands))
+        return None if reply is None else decode_results(reply)
+
+    # Broadcasts (address, command, data) entries for any number of slaves,
+    # packed into as few frames as possible. Returns the number of frames.
+    def broadcast_batch(self, entries):
+        frames = [(0, BATCH, payload) for payload in pack_entries(entries)]
+        self.send_batch(frames)
+        return len(frames)
+
     def prepare_ascii_frame(self, slave_address, command, data):
-        frame_data = f'{slave_address:02X}{command:02X}{binascii.hexlify(data).decode()}'
-        lrc = calculate_lrc(binascii.unhexlify(frame_data))
-        frame = f':{frame_data}{lrc:02X}\r\n'
-        return frame.encode()
+        return bytes(self.encoder.encode(ASCII_MODE, slave_address, command, data))
 
     def prepare_rtu_frame(self, slave_address, command, data):
-        frame = bytes([slave_address, command]) + data
-        frame += calculate_crc(frame)
-        return frame
-
-    def receive_response(self):
-        self.port.timeout = self.transaction_timeout
-        response = self.read_with_timeout()
-        print(f"Master received response: {response}")
+        return bytes(self.encoder.encode(RTU_MODE, slave_address, command, data))
+
+    # Writes frames that expect no reply (broadcasts, command 1) in one go.
+    # ASCII frames are self-delimiting and share a single write; RTU frames
+    # are only delimited by line silence, so each one is followed by t3.5.
+    # The gaps are timed from each frame's wire time rather than by draining
+    # the port, which would block the async master's event loop.
+    def send_batch(self, frames):
+        with self.lock:
+            self.run_steps(self.batch_writes(frames))
+
+    def batch_writes(self, frames):
+        buffer, bounds = self.encoder.encode_batch(self.mode, frames)
+        self.tracer.debug("Master sending batch of %d frames", len(bounds))
+        for slave_address, _, _ in frames:
+            self.metrics.inc('frames_sent', slave=slave_address)
+        if self.mode == ASCII_MODE:
+            for start, end in bounds:
+                self.record_frame(SENT, buffer[start:end])
+            self.port.write(buffer)
+            return
+        # Receivers end a frame after character_timeout of silence, which can
+        # be longer than t3.5. Waiting exactly that long leaves them no room
+        # for timer resolution or read latency, so add a margin.
+        gap = (max(self.t35, self.character_timeout)
+               + GAP_MARGIN_CHARACTERS * self.char_time + GAP_MARGIN_ALLOWANCE)
+        for start, end in bounds:
+            delay = self.line_idle_at + gap - time.monotonic()
+            if delay > 0:
+                yield delay
+            self.record_frame(SENT, buffer[start:end])
+            self.port.write(buffer[start:end])
+            self.line_idle_at = time.monotonic() + (end - start) * self.char_time
+
+    # A reply that arrives after its request timed out would otherwise be
+    # taken for the answer to the next one.
+    def discard_input(self):
+        self.reader.decoder.reset()
+        waiting = self.port.in_waiting
+        if waiting:
+            self.port.read(waiting)
+
+    def receive_response(self, timeout=None):
+        if timeout is None:
+            timeout = self.transaction_timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            response = self.reader.read_frame(timeout, self.character_timeout)
+            self.line_idle_at = time.monotonic()
+            self.tracer.debug("Master received response: %s", response)
+            self.record_frame(RECEIVED, response)
+            if not self.validate_response(response):
+                return False
+            if self.matches_request():
+                return True
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                self.failure = 'timeouts'
+                self.response = None
+                return False
+
+    # Counts and drops a valid frame that does not answer the request, e.g.
+    # a late reply from another slave; the caller keeps waiting.
+    def matches_request(self):
+        if self.expected is None:
+            return True
+        address, command = self.reply_header
+        expected_address, expected_command = self.expected
+        if address == expected_address and command & 0x7F == expected_command:
+            return True
+        self.metrics.inc('unexpected_replies', slave=address)
+        self.tracer.warning("Ignoring reply from %d, function %d", address, command)
+        self.response = None
+        return False
+
+    def validate_response(self, response):
+        if not response:
+            self.failure = 'timeouts'
+            self.presentExcpetion("No response")
+            return False
         if self.mode == ASCII_MODE:
             return self.validate_ascii_frame(response)
         else:
             return self.validate_rtu_frame(response)
 
-    def read_with_timeout(self):
-        response = bytearray()
-        while True:
-            char = self.port.read(1)
-            if not char:
-                break
-            response += char
-            self.port.timeout = self.character_timeout  # Set timeout for next character
-        return response
-
     def validate_ascii_frame(self, frame):
         if frame.startswith(b':') and frame.endswith(b'\r\n'):
             data_with_lrc = frame[1:-2]
-            lrc = int(frame[-4:-2], 16)
             data = data_with_lrc[:-2]
-            binary_data = binascii.unhexlify(data)
+            try:
+                lrc = int(frame[-4:-2], 16)
+                binary_data = binascii.unhexlify(data)
+            except (binascii.Error, ValueError):
+                self.failure = 'bad_frames'
+                self.presentExcpetion("Bad hex")
+                return False
             calculated_lrc = calculate_lrc(binary_data)
             
-            print("===============Processing Message================")
-            print(f"Data with LRC: {data_with_lrc}")
-            print(f"Data: {data}")
-            print(f"LRC: {lrc}")
-            print(f"Binary data: {binary_data}")
-            print(f"Calulcate lrc: {calculated_lrc}")
+            tracer = self.tracer
+            if tracer.debug_enabled:
+                tracer.debug("===============Processing Message================")
+                tracer.debug("Data with LRC: %s", data_with_lrc)
+                tracer.debug("Data: %s", data)
+                tracer.debug("LRC: %s", lrc)
+                tracer.debug("Binary data: %s", binary_data)
+                tracer.debug("Calulcate lrc: %s", calculated_lrc)
 
             if calculated_lrc == lrc:
-                print("Matching lrc values")
+                tracer.debug("Matching lrc values")
+                self.reply_header = (binary_data[0], binary_data[1])
                 self.presentResponse(binary_data[2:])
                 return True
             else:
+                self.failure = 'checksum_errors'
                 self.presentExcpetion("Bad lrc")
                 return False
+        self.failure = 'bad_frames'
         self.presentExcpetion("Bad frame")
         return False
 
     def validate_rtu_frame(self, frame):
-        if len(frame) >= 5:
+        if len(frame) >= 4:
             data, crc_received = frame[:-2], frame[-2:]
-            print("===============Processing Message================")
-            print(f"Frame: {frame}")
-            print(f"Data: {data}")
-            print(f"CRC: {bytes(crc_received)}")
-            print(f"Calulcate Crc: {calculate_crc(data)}")
-            if calculate_crc(data) == bytes(crc_received):
-                print("Matching crc values")
+            calculated_crc = calculate_crc(data)
+            tracer = self.tracer
+            if tracer.debug_enabled:
+                tracer.debug("===============Processing Message================")
+                tracer.debug("Frame: %s", frame)
+                tracer.debug("Data: %s", data)
+                tracer.debug("CRC: %s", bytes(crc_received))
+                tracer.debug("Calulcate Crc: %s", calculated_crc)
+            if calculated_crc == bytes(crc_received):
+                tracer.debug("Matching crc values")
+                self.reply_header = (data[0], data[1])
                 self.presentResponse(data[2:])
                 return True
             else:
+                self.failure = 'checksum_errors'
                 self.presentExcpetion("Bad crc")
                 return False
+        self.failure = 'bad_frames'
         self.presentExcpetion("Bad frame")
         return False
     
     def presentResponse(self, text):
-        print("===============Processing Response===============")
-        print(f"Master received text: {text.decode()}")
+        self.response = text
+        if self.tracer.debug_enabled:
+            self.tracer.debug("===============Processing Response===============")
+            self.tracer.debug("Master received text: %s", text.decode(errors='replace'))
         
     def presentExcpetion(self, reason):
-        print("==================Bad  response==================")
-        print(f"Reason: {reason}")
+        self.tracer.error("==================Bad  response==================\nReason: %s", reason)
+
+
+class RequestWorker:
+    # Runs transactions on a background thread so the caller never waits on
+    # the line. Finished requests are queued as (request_id, response,
+    # latency, error) for the owner to collect with drain(), e.g. from a
+    # root.after poll on the GUI thread.
+    def __init__(self, master):
+        self.master = master
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.ids = itertools.count(1)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, slave_address, command, data):
+        request_id = next(self.ids)
+        self.requests.put((request_id, slave_address, command, data))
+        return request_id
+
+    def pending(self):
+        return self.requests.qsize()
+
+    def run(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            request_id, slave_address, command, data = item
+            started = time.perf_counter()
+            try:
+                response = self.master.request(slave_address, command, data)
+                error = None
+            except Exception as e:
+                response = None
+                error = e
+            self.results.put((request_id, response, time.perf_counter() - started, error))
+
+    def drain(self):
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
 
 
 def send_message():
@@ -161,14 +595,40 @@ def send_message():
         slave_address = int(slave_address_entry.get())
         command = int(command_entry.get())
         data = data_entry.get().encode()
-        master.send_frame(slave_address, command, data)
     except Exception as e:
         messagebox.showerror("Error", str(e))
+        return
+    request_id = worker.submit(slave_address, command, data)
+    requests_view.insert('', 'end', iid=str(request_id),
+                         values=(request_id, slave_address, command, "queued", "", ""))
+    queue_text.set(f"Queued: {worker.pending()}")
+
+def poll_results():
+    for request_id, response, latency, error in worker.drain():
+        if error is not None:
+            outcome, shown = "error", str(error)
+        elif response is None:
+            outcome, shown = "no response", ""
+        elif not response:
+            outcome, shown = "sent", ""
+        else:
+            outcome, shown = "ok", response.decode(errors='replace')
+            response_text.set(shown)
+        requests_view.set(str(request_id), 'outcome', outcome)
+        requests_view.set(str(request_id), 'latency', f"{1000 * latency:.1f} ms")
+        requests_view.set(str(request_id), 'response', shown)
+        requests_view.see(str(request_id))
+    queue_text.set(f"Queued: {worker.pending()}")
+    root.after(50, poll_results)
 
 if __name__ == "__main__":
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+
     master_port = 'COM5'
-    master = ModbusMaster(port=master_port, mode=RTU_MODE)
+    master = ModbusMaster(port=master_port, mode=RTU_MODE, tracer=Tracer(DEBUG, history=32))
     master.set_parameters(baudrate=9600, bytesize=8, parity='N', stopbits=1)
+    worker = RequestWorker(master)
     
     root = tk.Tk()
     root.title("Modbus Master GUI")
@@ -195,4 +655,16 @@ if __name__ == "__main__":
     response_label = ttk.Label(frame, textvariable=response_text)
     response_label.grid(column=1, row=5, columnspan=2, sticky=(tk.W, tk.E))
 
-    root.mainloop()
\ No newline at end of file
+    queue_text = tk.StringVar(value="Queued: 0")
+    ttk.Label(frame, textvariable=queue_text).grid(column=1, row=6, columnspan=2, sticky=tk.W)
+
+    columns = ('id', 'slave', 'command', 'outcome', 'latency', 'response')
+    requests_view = ttk.Treeview(frame, columns=columns, show='headings', height=10)
+    for column, width in zip(columns, (40, 50, 70, 90, 80, 220)):
+        requests_view.heading(column, text=column.capitalize())
+        requests_view.column(column, width=width)
+    requests_view.grid(column=1, row=7, columnspan=2, sticky=(tk.W, tk.E))
+
+    root.after(50, poll_results)
+    root.mainloop()
+    worker.stop()
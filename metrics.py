@@ -0,0 +1,128 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Serial round trips range from a few milliseconds to the transaction timeout.
+LATENCY_BUCKETS = (0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            buckets.append((bound, total))
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Metrics:
+    # Counters and histograms keyed by name and label values. Updating one is
+    # a dict lookup and an add, cheap enough to leave on in every master and
+    # slave.
+    def __init__(self, prefix, buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.counters = defaultdict(int)
+        self.histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        self.counters[name, tuple(labels.items())] += amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def get(self, name, **labels):
+        return self.counters.get((name, tuple(labels.items())), 0)
+
+    def snapshot(self):
+        return {
+            'counters': dict(self.counters),
+            'histograms': {key: histogram.snapshot() for key, histogram in list(self.histograms.items())},
+        }
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+    def families(self):
+        snapshot = self.snapshot()
+        families = {}
+        for (name, labels), value in snapshot['counters'].items():
+            metric = f'{self.prefix}_{name}_total'
+            lines = families.setdefault(metric, ('counter', []))[1]
+            lines.append(f'{metric}{format_labels(labels)} {value}')
+        for (name, labels), histogram in snapshot['histograms'].items():
+            metric = f'{self.prefix}_{name}'
+            lines = families.setdefault(metric, ('histogram', []))[1]
+            for bound, count in histogram['buckets']:
+                lines.append(f'{metric}_bucket{format_labels(labels + (("le", bound),))} {count}')
+            lines.append(f'{metric}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram["count"]}')
+            lines.append(f'{metric}_sum{format_labels(labels)} {histogram["sum"]}')
+            lines.append(f'{metric}_count{format_labels(labels)} {histogram["count"]}')
+        return families
+
+    def prometheus(self):
+        return prometheus_text([self])
+
+
+def prometheus_text(registries):
+    # Registries can share a prefix (several slaves in one process), but the
+    # text format wants each metric family declared once with all its samples.
+    merged = {}
+    for registry in registries:
+        for metric, (kind, lines) in registry.families().items():
+            merged.setdefault(metric, (kind, []))[1].extend(lines)
+    output = []
+    for metric in sorted(merged):
+        kind, lines = merged[metric]
+        output.append(f'# TYPE {metric} {kind}')
+        output.extend(lines)
+    return '\n'.join(output) + '\n'
+
+
+def serve_metrics(registries, port=9100, host='127.0.0.1'):
+    # Serves every registry on /metrics from a daemon thread; call shutdown()
+    # on the returned server to stop it.
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text(registries).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
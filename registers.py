@@ -0,0 +1,209 @@
+import array
+import struct
+import sys
+
+# Standard Modbus function codes for the register and coil tables. Codes 1
+# and 2 (read coils and discrete inputs in the standard) are the text
+# commands here, so coils can be written but not read over the line.
+READ_HOLDING_REGISTERS = 3
+READ_INPUT_REGISTERS = 4
+WRITE_SINGLE_REGISTER = 6
+WRITE_MULTIPLE_COILS = 15
+WRITE_MULTIPLE_REGISTERS = 16
+
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+
+MAX_READ_REGISTERS = 125
+MAX_WRITE_REGISTERS = 123
+MAX_WRITE_COILS = 1968
+
+RANGE = struct.Struct('>HH')
+WRITE_HEADER = struct.Struct('>HHB')
+
+BIG_ENDIAN = sys.byteorder == 'big'
+
+
+class ModbusError(Exception):
+    # Raised by a handler to answer with an exception response.
+    def __init__(self, code):
+        super().__init__(f"Modbus exception {code}")
+        self.code = code
+
+
+def exception_reply(command, code):
+    return command | 0x80, bytes((code,))
+
+def check_reply(reply):
+    # Every normal reply to these commands is longer than one byte, so a
+    # single byte can only be an exception code.
+    if reply is not None and len(reply) == 1:
+        raise ModbusError(reply[0])
+    return reply
+
+
+class DataStore:
+    # Register tables are arrays of 16-bit words kept in wire (big-endian)
+    # byte order, so requests are served by slicing the raw bytes straight
+    # into the frame. Coils are a bitset, bit n of byte n // 8 as on the
+    # wire. get/set convert single values for the device's own code.
+    def __init__(self, holding_registers=0, input_registers=0, coils=0):
+        self.holding = array.array('H', bytes(2 * holding_registers))
+        self.inputs = array.array('H', bytes(2 * input_registers))
+        self.holding_bytes = memoryview(self.holding).cast('B')
+        self.input_bytes = memoryview(self.inputs).cast('B')
+        self.coil_count = coils
+        self.coils = bytearray((coils + 7) // 8)
+
+    def registers(self, table, start, count):
+        values = table[start:start + count]
+        if not BIG_ENDIAN:
+            values.byteswap()
+        return values
+
+    def set_registers(self, table, start, values):
+        values = array.array('H', values)
+        if start + len(values) > len(table):
+            raise IndexError(f"Registers {start}-{start + len(values) - 1} out of range")
+        if not BIG_ENDIAN:
+            values.byteswap()
+        table[start:start + len(values)] = values
+
+    def get_register(self, table, index):
+        return self.registers(table, index, 1)[0]
+
+    def set_register(self, table, index, value):
+        self.set_registers(table, index, (value,))
+
+    def get_coil(self, index):
+        return bool(self.coils[index >> 3] >> (index & 7) & 1)
+
+    def set_coil(self, index, value):
+        if value:
+            self.coils[index >> 3] |= 1 << (index & 7)
+        else:
+            self.coils[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def read_coils(self, start, count):
+        first = start >> 3
+        last = (start + count + 7) >> 3
+        bits = int.from_bytes(self.coils[first:last], 'little') >> (start & 7)
+        return (bits & ((1 << count) - 1)).to_bytes((count + 7) >> 3, 'little')
+
+    def write_coils(self, start, count, packed):
+        first = start >> 3
+        last = (start + count + 7) >> 3
+        shift = start & 7
+        mask = ((1 << count) - 1) << shift
+        bits = int.from_bytes(self.coils[first:last], 'little') & ~mask
+        bits |= (int.from_bytes(packed, 'little') << shift) & mask
+        self.coils[first:last] = bits.to_bytes(last - first, 'little')
+
+
+def data_store(target):
+    store = target.store
+    if store is None:
+        raise ModbusError(ILLEGAL_DATA_ADDRESS)
+    return store
+
+
+# Slave side. Each handler takes the object holding the store (a ModbusSlave
+# or a server Unit) and the request payload.
+
+def read_registers(view, data):
+    if len(data) != RANGE.size:
+        raise ModbusError(ILLEGAL_DATA_VALUE)
+    start, count = RANGE.unpack(data)
+    if not 1 <= count <= MAX_READ_REGISTERS:
+        raise ModbusError(ILLEGAL_DATA_VALUE)
+    if 2 * (start + count) > len(view):
+        raise ModbusError(ILLEGAL_DATA_ADDRESS)
+    return bytes((2 * count,)) + view[2 * start:2 * (start + count)]
+
+def read_holding_registers(target, data):
+    return read_registers(data_store(target).holding_bytes, data)
+
+def read_input_registers(target, data):
+    return read_registers(data_store(target).input_bytes, data)
+
+def write_single_register(target, data):
+    view = data_store(target).holding_bytes
+    if len(data) != RANGE.size:
+        raise ModbusError(ILLEGAL_DATA_VALUE)
+    index = RANGE.unpack(data)[0]
+    if 2 * index + 2 > len(view):
+        raise ModbusError(ILLEGAL_DATA_ADDRESS)
+    view[2 * index:2 * index + 2] = data[2:4]
+    return bytes(data)
+
+def write_multiple_registers(target, data):
+    view = data_store(target).holding_bytes
+    if len(data) < WRITE_HEADER.size:
+        raise ModbusError(ILLEGAL_DATA_VALUE)
+    start, count, byte_count = WRITE_HEADER.unpack_from(data)
+    if (not 1 <= count <= MAX_WRITE_REGISTERS or byte_count != 2 * count
+            or len(data) != WRITE_HEADER.size + byte_count):
+        raise ModbusError(ILLEGAL_DATA_VALUE)
+    if 2 * (start + count) > len(view):
+        raise ModbusError(ILLEGAL_DATA_ADDRESS)
+    view[2 * start:2 * (start + count)] = data[WRITE_HEADER.size:]
+    return RANGE.pack(start, count)
+
+def write_multiple_coils(target, data):
+    store = data_store(target)
+    if len(data) < WRITE_HEADER.size:
+        raise ModbusError(ILLEGAL_DATA_VALUE)
+    start, count, byte_count = WRITE_HEADER.unpack_from(data)
+    if (not 1 <= count <= MAX_WRITE_COILS or byte_count != (count + 7) >> 3
+            or len(data) != WRITE_HEADER.size + byte_count):
+        raise ModbusError(ILLEGAL_DATA_VALUE)
+    if start + count > store.coil_count:
+        raise ModbusError(ILLEGAL_DATA_ADDRESS)
+    store.write_coils(start, count, data[WRITE_HEADER.size:])
+    return RANGE.pack(start, count)
+
+REGISTER_HANDLERS = {
+    READ_HOLDING_REGISTERS: read_holding_registers,
+    READ_INPUT_REGISTERS: read_input_registers,
+    WRITE_SINGLE_REGISTER: write_single_register,
+    WRITE_MULTIPLE_COILS: write_multiple_coils,
+    WRITE_MULTIPLE_REGISTERS: write_multiple_registers,
+}
+
+
+# Master side: request payloads and reply decoding.
+
+def encode_read(start, count):
+    if not 1 <= count <= MAX_READ_REGISTERS:
+        raise ValueError(f"Register count out of range: {count}")
+    return RANGE.pack(start, count)
+
+def encode_write_registers(start, values):
+    values = array.array('H', values)
+    if not 1 <= len(values) <= MAX_WRITE_REGISTERS:
+        raise ValueError(f"Register count out of range: {len(values)}")
+    if not BIG_ENDIAN:
+        values.byteswap()
+    return WRITE_HEADER.pack(start, len(values), 2 * len(values)) + values.tobytes()
+
+def encode_write_coils(start, values):
+    count = len(values)
+    if not 1 <= count <= MAX_WRITE_COILS:
+        raise ValueError(f"Coil count out of range: {count}")
+    packed = bytearray((count + 7) >> 3)
+    for index, value in enumerate(values):
+        if value:
+            packed[index >> 3] |= 1 << (index & 7)
+    return WRITE_HEADER.pack(start, count, len(packed)) + packed
+
+def write_acknowledged(reply):
+    return None if check_reply(reply) is None else True
+
+def decode_registers(reply, count):
+    if check_reply(reply) is None or len(reply) != 1 + 2 * count or reply[0] != 2 * count:
+        return None
+    values = array.array('H', bytes(reply[1:]))
+    if not BIG_ENDIAN:
+        values.byteswap()
+    return values
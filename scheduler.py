@@ -0,0 +1,135 @@
+import heapq
+import itertools
+import time
+from timing import frame_gap
+
+
+class PollJob:
+    def __init__(self, slave_address, command, period, priority=0, data=b''):
+        self.slave_address = slave_address
+        self.command = command
+        self.period = period
+        self.priority = priority
+        self.data = data
+        self.next_run = 0.0
+        self.skip_until = 0.0
+        self.failures = 0
+        self.polls = 0
+        self.timeouts = 0
+        self.deadline_misses = 0
+        self.last_response = None
+        self.active = True
+
+
+class PollingScheduler:
+    def __init__(self, master, inter_frame_gap=None, failure_threshold=2, max_backoff=60.0,
+                 on_deadline_miss=None, on_result=None):
+        self.master = master
+        if inter_frame_gap is None:
+            port = master.port
+            inter_frame_gap = frame_gap(port.baudrate, port.bytesize, port.parity, port.stopbits)
+        self.inter_frame_gap = inter_frame_gap
+        self.failure_threshold = failure_threshold
+        self.max_backoff = max_backoff
+        self.on_deadline_miss = on_deadline_miss or self.report_deadline_miss
+        self.on_result = on_result
+        self.jobs = []
+        self.pending = []
+        self.counter = itertools.count()
+        self.last_frame_end = 0.0
+        self.running = False
+
+    def add_job(self, slave_address, command, period, priority=0, data=b''):
+        job = PollJob(slave_address, command, period, priority, data)
+        job.next_run = time.monotonic()
+        self.jobs.append(job)
+        heapq.heappush(self.pending, (job.next_run, next(self.counter), job))
+        return job
+
+    def remove_job(self, job):
+        job.active = False
+        self.jobs.remove(job)
+
+    def stop(self):
+        self.running = False
+
+    def run(self, duration=None):
+        self.running = True
+        end = None if duration is None else time.monotonic() + duration
+        while self.running and self.pending:
+            now = time.monotonic()
+            if end is not None and now >= end:
+                break
+            wait = self.pending[0][0] - now
+            if end is not None:
+                wait = min(wait, end - now)
+            if wait > 0:
+                time.sleep(wait)
+            self.run_pending()
+        self.running = False
+
+    def run_pending(self):
+        now = time.monotonic()
+        ready = []
+        while self.pending and self.pending[0][0] <= now:
+            due, _, job = heapq.heappop(self.pending)
+            if not job.active:
+                continue
+            # Higher priority goes on the bus first, then the most overdue job.
+            heapq.heappush(ready, (-job.priority, due, next(self.counter), job))
+
+        executed = 0
+        while ready:
+            _, due, _, job = heapq.heappop(ready)
+            if job.skip_until > time.monotonic():
+                self.reschedule(job, due)
+                continue
+            self.wait_for_gap()
+            started = time.monotonic()
+            if started > due + job.period:
+                job.deadline_misses += 1
+                self.on_deadline_miss(job, started - due)
+            self.poll(job)
+            executed += 1
+            self.reschedule(job, due)
+        return executed
+
+    def wait_for_gap(self):
+        wait = self.last_frame_end + self.inter_frame_gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def poll(self, job):
+        response = self.master.request(job.slave_address, job.command, job.data)
+        self.last_frame_end = time.monotonic()
+        job.polls += 1
+        ok = response is not None
+        if ok:
+            job.failures = 0
+            job.skip_until = 0.0
+            job.last_response = response
+        else:
+            job.failures += 1
+            job.timeouts += 1
+            if job.failures >= self.failure_threshold:
+                backoff = min(self.max_backoff, job.period * 2 ** (job.failures - self.failure_threshold))
+                job.skip_until = self.last_frame_end + backoff
+        if self.on_result is not None:
+            self.on_result(job, ok)
+
+    def reschedule(self, job, due):
+        if not job.active:
+            return
+        next_run = due + job.period
+        now = time.monotonic()
+        if next_run <= now:
+            # Fell more than a period behind: drop the missed slots instead of bursting.
+            missed = int((now - next_run) // job.period) + 1
+            next_run += missed * job.period
+        next_run = max(next_run, job.skip_until)
+        job.next_run = next_run
+        heapq.heappush(self.pending, (next_run, next(self.counter), job))
+
+    def report_deadline_miss(self, job, lateness):
+        self.master.tracer.warning("Deadline missed: slave %d command %d late by %.3fs",
+                                   job.slave_address, job.command, lateness)
@@ -0,0 +1,203 @@
+import binascii
+from checksum import calculate_lrc, calculate_crc
+from slave import ModbusSlave, ASCII_MODE
+from tracing import SENT
+from transfer import CHUNK_HANDLERS, single_frame
+from link import LINK_SETTINGS
+from batch import BATCH, run_entries
+from compression import (COMPRESSION, WRITE_TEXT_COMPRESSED, READ_TEXT_COMPRESSED,
+                         select_dictionary, compress, decompress)
+from registers import REGISTER_HANDLERS, ModbusError, exception_reply
+
+
+def write_text(unit, text):
+    # Any bytes are valid on the wire; a bad payload must not take the
+    # server down.
+    unit.text = bytes(text).decode(errors='replace')
+    return None
+
+def read_text(unit, data):
+    return single_frame(unit.text.encode())
+
+def compression_dictionary(unit, offered):
+    return select_dictionary(offered)
+
+def write_compressed_text(unit, payload):
+    try:
+        text = decompress(payload)
+    except ValueError:
+        return None
+    return write_text(unit, text)
+
+def read_compressed_text(unit, data):
+    return single_frame(compress(unit.text.encode()))
+
+DEFAULT_HANDLERS = {
+    1: write_text,
+    2: read_text,
+    COMPRESSION: compression_dictionary,
+    WRITE_TEXT_COMPRESSED: write_compressed_text,
+    READ_TEXT_COMPRESSED: read_compressed_text,
+    **CHUNK_HANDLERS,
+    **REGISTER_HANDLERS,
+}
+
+
+class Unit:
+    __slots__ = ('address', 'handlers', 'current_text', 'version', 'state', 'transfer', 'store')
+
+    def __init__(self, address, handlers=None, text="Sample text from slave", store=None):
+        self.address = address
+        # Units without their own handlers share the default table.
+        self.handlers = handlers if handlers is not None else DEFAULT_HANDLERS
+        self.version = 0
+        self.text = text
+        self.state = None
+        self.transfer = None
+        self.store = store
+
+    @property
+    def text(self):
+        return self.current_text
+
+    @text.setter
+    def text(self, text):
+        self.current_text = text
+        self.version += 1
+
+    def register(self, command, handler):
+        if self.handlers is DEFAULT_HANDLERS:
+            self.handlers = dict(DEFAULT_HANDLERS)
+        self.handlers[command] = handler
+
+
+class ModbusServer(ModbusSlave):
+    def __init__(self, port, mode=ASCII_MODE, tracer=None, metrics=None):
+        super().__init__(port, None, mode, tracer, metrics)
+        self.units = {}
+        self.cached_handlers = {read_text, read_compressed_text}
+
+    def add_unit(self, address, handlers=None, text="Sample text from slave", store=None):
+        if not 1 <= address <= 247:
+            raise ValueError(f"Unit address out of range: {address}")
+        if handlers is not None:
+            handlers = {**DEFAULT_HANDLERS, **handlers}
+        unit = Unit(address, handlers, text, store)
+        self.units[address] = unit
+        # A replaced unit starts over at the same version, so its
+        # predecessor's cached replies would still match.
+        self.response_cache.invalidate(address)
+        return unit
+
+    def remove_unit(self, address):
+        self.units.pop(address, None)
+        self.response_cache.invalidate(address)
+
+    def invalidate_unit(self, address):
+        self.units[address].version += 1
+        self.response_cache.invalidate(address)
+
+    def handle_ascii_frame(self, frame):
+        if len(frame) < 9 or frame[:1] != b':' or frame[-2:] != b'\r\n':
+            self.metrics.inc('bad_frames')
+            return
+        try:
+            address = int(frame[1:3], 16)
+        except ValueError:
+            self.metrics.inc('bad_frames')
+            return
+        if address != 0 and address not in self.units:
+            return
+        try:
+            binary_data = binascii.unhexlify(frame[1:-2])
+        except (binascii.Error, ValueError):
+            self.metrics.inc('bad_frames', slave=address)
+            self.tracer.error("Bad frame")
+            return
+        if calculate_lrc(binary_data[:-1]) != binary_data[-1]:
+            self.metrics.inc('checksum_errors', slave=address)
+            self.tracer.error("LRC validation failed")
+            return
+        self.dispatch(binary_data[:-1])
+
+    def handle_rtu_frame(self, frame):
+        if len(frame) < 4:
+            self.metrics.inc('bad_frames')
+            return
+        address = frame[0]
+        if address != 0 and address not in self.units:
+            return
+        data = frame[:-2]
+        if calculate_crc(data) != bytes(frame[-2:]):
+            self.metrics.inc('checksum_errors', slave=address)
+            self.tracer.error("CRC validation failed")
+            return
+        self.dispatch(data)
+
+    def dispatch(self, data):
+        address = data[0]
+        command = data[1]
+        payload = data[2:]
+        metrics = self.metrics
+        self.link_fallback = None
+        if command == LINK_SETTINGS:
+            # Line settings belong to the port, not to one unit.
+            metrics.inc('requests', slave=address, command=command)
+            response = self.link_settings(payload)
+            if address != 0:
+                metrics.inc('responses', slave=address, command=command)
+                self.write_response(self.prepare_response(command, response, address))
+            return
+        if command == BATCH:
+            metrics.inc('requests', slave=address, command=command)
+            self.run_batch(address, payload)
+            return
+        if address == 0:
+            for unit in list(self.units.values()):
+                handler = unit.handlers.get(command)
+                if handler is not None:
+                    metrics.inc('requests', slave=unit.address, command=command)
+                    try:
+                        handler(unit, payload)
+                    except ModbusError as e:
+                        metrics.inc('exceptions', slave=unit.address, command=command, code=e.code)
+            return
+        unit = self.units[address]
+        handler = unit.handlers.get(command)
+        if handler is None:
+            metrics.inc('unsupported_commands', slave=address, command=command)
+            self.tracer.warning("Unit %d: unsupported command %d", address, command)
+            return
+        metrics.inc('requests', slave=address, command=command)
+        if handler in self.cached_handlers:
+            key = (self.mode, address, command, unit.version)
+            frame = self.cached_response(key, handler, unit, payload)
+            if frame is not None:
+                metrics.inc('responses', slave=address, command=command)
+                self.write_response(frame)
+            return
+        reply_command = command
+        try:
+            response = handler(unit, payload)
+        except ModbusError as e:
+            metrics.inc('exceptions', slave=address, command=command, code=e.code)
+            reply_command, response = exception_reply(command, e.code)
+        if response is not None:
+            metrics.inc('responses', slave=address, command=command)
+            self.send_unit_response(unit, reply_command, response)
+
+    def run_batch(self, address, payload):
+        units = list(self.units.values()) if address == 0 else [self.units[address]]
+        for unit in units:
+            response = run_entries(payload, unit.address, unit.handlers,
+                                   lambda handler, data: handler(unit, data))
+        if address != 0:
+            self.metrics.inc('responses', slave=address, command=BATCH)
+            self.send_unit_response(unit, BATCH, response)
+
+    def send_unit_response(self, unit, command, data):
+        response = self.prepare_response(command, data, unit.address)
+        if self.tracer.debug_enabled:
+            self.tracer.debug("Unit %d sending response: %s", unit.address, bytes(response))
+        self.record_frame(SENT, response)
+        self.port.write(response)
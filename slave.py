@@ -1,5 +1,21 @@
-import serial
+import time
 import binascii
+from functools import partial
+from checksum import calculate_lrc, calculate_crc
+from framing import FrameReader, FrameEncoder
+from transport import open_transport
+from tracing import Tracer, DEBUG, SENT, RECEIVED
+from cache import ResponseCache
+from timing import rtu_gaps, ASCII_CHARACTER_TIMEOUT
+from transfer import CHUNK_HANDLERS, single_frame
+from metrics import Metrics
+from capture import port_label
+from link import (LINK_SETTINGS, PROPOSAL, ACCEPT, REJECT, STANDARD_BAUDRATES,
+                  decode_proposal, encode_settings)
+from batch import BATCH, run_entries
+from compression import (COMPRESSION, WRITE_TEXT_COMPRESSED, READ_TEXT_COMPRESSED,
+                         select_dictionary, compress, decompress)
+from registers import REGISTER_HANDLERS, ModbusError, exception_reply
 
 ASCII_MODE = 'ASCII'
 RTU_MODE = 'RTU'
@@ -7,25 +23,6 @@ RTU_MODE = 'RTU'
 MASTER = 'Master'
 SLAVE = 'Slave'
 
-def calculate_lrc(data):
-    lrc = 0
-    for byte in data:
-        lrc += byte
-    lrc = ((lrc ^ 0xFF) + 1) & 0xFF
-    return lrc
-
-def calculate_crc(data):
-    crc = 0xFFFF
-    for pos in data:
-        crc ^= pos
-        for _ in range(8):
-            if (crc & 1) != 0:
-                crc >>= 1
-                crc ^= 0xA001
-            else:
-                crc >>= 1
-    return crc.to_bytes(2, byteorder='little')
-
 def ascii_to_rtu(frame):
     return binascii.unhexlify(frame)
 
@@ -33,19 +30,131 @@ def rtu_to_ascii(frame):
     return binascii.hexlify(frame).upper()
 
 class ModbusSlave:
-    def __init__(self, port, address, mode=ASCII_MODE):
-        self.port = serial.Serial(port)
+    def __init__(self, port, address, mode=ASCII_MODE, tracer=None, metrics=None):
+        self.port = open_transport(port)
         self.address = address
         self.mode = mode
         self.timeout = 1.0
         self.running = False
-        self.character_timeout = 0.01
+        self.tracer = tracer or Tracer()
+        self.metrics = metrics or Metrics('modbus_slave')
+        self.capture = None
+        self.reader = FrameReader(self.port, mode)
+        self.reader.decoder.on_discard = self.count_discarded
+        self.encoder = FrameEncoder()
+        self.response_cache = ResponseCache()
+        self.data_version = 0
+        self.text = "Sample text from slave"
+        self.handlers = {
+            1: self.write_text,
+            2: self.read_text,
+        }
+        self.transfer = None
+        self.store = None
+        for command, handler in {**CHUNK_HANDLERS, **REGISTER_HANDLERS}.items():
+            self.handlers[command] = partial(handler, self)
+        self.handlers[LINK_SETTINGS] = self.link_settings
+        self.handlers[BATCH] = self.run_batch
+        self.handlers[COMPRESSION] = select_dictionary
+        self.handlers[WRITE_TEXT_COMPRESSED] = self.write_compressed_text
+        self.handlers[READ_TEXT_COMPRESSED] = self.read_compressed_text
+        self.supported_baudrates = set(STANDARD_BAUDRATES)
+        self.supported_modes = {ASCII_MODE, RTU_MODE}
+        self.pending_link = None
+        self.link_fallback = None
+        self.link_deadline = 0.0
+        # Commands whose reply depends only on the slave's data, not on the
+        # request payload, so the encoded frame can be reused until it changes.
+        self.cached_commands = {2, READ_TEXT_COMPRESSED}
+        self.update_timing()
+
+    @property
+    def text(self):
+        return self.current_text
+
+    @text.setter
+    def text(self, text):
+        self.current_text = text
+        self.invalidate()
+
+    def invalidate(self):
+        self.data_version += 1
+        self.response_cache.invalidate(self.address)
 
     def set_parameters(self, baudrate, bytesize, parity, stopbits):
         self.port.baudrate = baudrate
         self.port.bytesize = bytesize
         self.port.parity = parity
         self.port.stopbits = stopbits
+        self.update_timing()
+
+    def update_timing(self):
+        port = self.port
+        self.t15, self.t35 = rtu_gaps(port.baudrate, port.bytesize, port.parity, port.stopbits)
+        if self.mode == ASCII_MODE:
+            self.character_timeout = ASCII_CHARACTER_TIMEOUT
+        else:
+            self.character_timeout = self.t35
+
+    def count_discarded(self, count):
+        self.metrics.inc('resyncs')
+        self.metrics.inc('discarded_bytes', count)
+
+    def set_mode(self, mode):
+        self.mode = mode
+        self.reader.decoder.mode = mode
+        self.reader.decoder.reset()
+        self.update_timing()
+
+    def apply_link(self, baudrate, mode):
+        port = self.port
+        self.set_parameters(baudrate, port.bytesize, port.parity, port.stopbits)
+        self.set_mode(mode)
+
+    def link_settings(self, data):
+        port = self.port
+        if not data:
+            return encode_settings(port.baudrate, self.mode)
+        if len(data) != PROPOSAL.size:
+            return REJECT
+        baudrate, mode, verify_timeout = decode_proposal(data)
+        if baudrate not in self.supported_baudrates or mode not in self.supported_modes:
+            self.tracer.warning("Rejecting link settings: %s baud, %s", baudrate, mode)
+            return REJECT
+        # The accept still goes out with the old settings; listen() switches
+        # once it has been written.
+        self.pending_link = (baudrate, mode, verify_timeout)
+        return ACCEPT
+
+    def switch_link(self):
+        baudrate, mode, verify_timeout = self.pending_link
+        self.pending_link = None
+        self.port.flush()
+        self.link_fallback = (self.port.baudrate, self.mode)
+        self.link_deadline = time.monotonic() + verify_timeout
+        self.tracer.info("Switching link to %s baud, %s", baudrate, mode)
+        self.apply_link(baudrate, mode)
+
+    # Any frame for this slave under the new settings confirms them; if none
+    # comes before the deadline the master could not follow, so go back.
+    def check_link(self):
+        if self.link_fallback is not None and time.monotonic() >= self.link_deadline:
+            baudrate, mode = self.link_fallback
+            self.link_fallback = None
+            self.tracer.warning("Link not verified, falling back to %s baud, %s", baudrate, mode)
+            self.apply_link(baudrate, mode)
+
+    def start_capture(self, writer, port_name=None):
+        self.capture = writer
+        self.capture_port = port_name or port_label(self.port)
+
+    def stop_capture(self):
+        self.capture = None
+
+    def record_frame(self, direction, frame):
+        self.tracer.frame(direction, frame)
+        if self.capture is not None and frame:
+            self.capture.write(self.capture_port, direction, self.mode, frame)
 
     def start(self):
         self.running = True
@@ -56,102 +165,173 @@ class ModbusSlave:
 
     def listen(self):
         while self.running:
-            self.port.timeout = None
-            frame = self.read_with_timeout()
-            if self.mode == ASCII_MODE:
-                self.handle_ascii_frame(frame)
-            else:
-                self.handle_rtu_frame(frame)
-
-    def read_with_timeout(self):
-        response = bytearray()
-        while True:
-            char = self.port.read(1)
-            if not char:
-                break
-            response += char
-            self.port.timeout = self.character_timeout  # Set timeout for next character
-        return response
+            timeout = self.timeout
+            if self.link_fallback is not None:
+                timeout = max(0.0, min(timeout, self.link_deadline - time.monotonic()))
+            frame = self.reader.read_frame(timeout, self.character_timeout)
+            self.check_link()
+            if frame:
+                self.handle_frame(frame)
+
+    def handle_frame(self, frame):
+        self.record_frame(RECEIVED, frame)
+        if self.mode == ASCII_MODE:
+            self.handle_ascii_frame(frame)
+        else:
+            self.handle_rtu_frame(frame)
+        if self.pending_link is not None:
+            self.switch_link()
 
     def handle_ascii_frame(self, frame):
-        if frame.startswith(b':') and frame.endswith(b'\r\n'):
+        # Shortest frame: ':', address, function, LRC, CR LF.
+        if len(frame) >= 9 and frame.startswith(b':') and frame.endswith(b'\r\n'):
             data_with_lrc = frame[1:-2]
-            lrc = int(frame[-4:-2], 16)
             data = data_with_lrc[:-2]
-            binary_data = binascii.unhexlify(data)
+            try:
+                lrc = int(frame[-4:-2], 16)
+                binary_data = binascii.unhexlify(data)
+            except (binascii.Error, ValueError):
+                self.metrics.inc('bad_frames', slave=self.address)
+                self.tracer.error("Bad frame")
+                return
             calculated_lrc = calculate_lrc(binary_data)
             
-            print("===============Processing Message================")
-            print(f"Data with LRC: {data_with_lrc}")
-            print(f"Data: {data}")
-            print(f"LRC: {lrc}")
-            print(f"Binary data: {binary_data}")
-            print(f"Calulcate lrc: {calculated_lrc}")
+            tracer = self.tracer
+            if tracer.debug_enabled:
+                tracer.debug("===============Processing Message================")
+                tracer.debug("Data with LRC: %s", data_with_lrc)
+                tracer.debug("Data: %s", data)
+                tracer.debug("LRC: %s", lrc)
+                tracer.debug("Binary data: %s", binary_data)
+                tracer.debug("Calulcate lrc: %s", calculated_lrc)
 
             if calculated_lrc == lrc:
-                print("Matching lrc values")
+                tracer.debug("Matching lrc values")
                 slave_address = int(data[0:2], 16)
                 if slave_address == self.address or slave_address == 0:
-                    print("Matching slave address")
-                    self.process_command(binascii.unhexlify(data))
+                    tracer.debug("Matching slave address")
+                    self.process_command(binary_data)
             else:
-                print("LRC validation failed")
+                self.metrics.inc('checksum_errors', slave=self.address)
+                tracer.error("LRC validation failed")
+        else:
+            self.metrics.inc('bad_frames', slave=self.address)
 
     def handle_rtu_frame(self, frame):
-        print(frame)
-        if len(frame) >= 3:
+        # Shortest frame: address, function, CRC.
+        if len(frame) >= 4:
             data, crc_received = frame[:-2], frame[-2:]
-            print("===============Processing Message================")
-            print(f"Frame: {frame}")
-            print(f"Data: {data}")
-            print(f"CRC: {bytes(crc_received)}")
-            print(f"Calulcate Crc: {calculate_crc(data)}")
-            if calculate_crc(data) == bytes(crc_received):
+            calculated_crc = calculate_crc(data)
+            tracer = self.tracer
+            if tracer.debug_enabled:
+                tracer.debug("===============Processing Message================")
+                tracer.debug("Frame: %s", frame)
+                tracer.debug("Data: %s", data)
+                tracer.debug("CRC: %s", bytes(crc_received))
+                tracer.debug("Calulcate Crc: %s", calculated_crc)
+            if calculated_crc == bytes(crc_received):
                 slave_address = data[0]
-                print("Matching crc values")
+                tracer.debug("Matching crc values")
                 if slave_address == self.address or slave_address == 0:
-                    print("Matching slave address")
+                    tracer.debug("Matching slave address")
                     self.process_command(data)
+            else:
+                self.metrics.inc('checksum_errors', slave=self.address)
+                tracer.error("CRC validation failed")
+        else:
+            self.metrics.inc('bad_frames', slave=self.address)
 
     def process_command(self, data):
         command = data[1]
-        if command == 1:
-            self.write_text(data[2:])
-        elif command == 2:
-            self.read_text()
+        metrics = self.metrics
+        self.link_fallback = None
+        handler = self.handlers.get(command)
+        if handler is None:
+            metrics.inc('unsupported_commands', slave=self.address, command=command)
+            self.tracer.warning("Unsupported command: %d", command)
+            return
+        metrics.inc('requests', slave=self.address, command=command)
+        # Broadcasts are never answered, or every slave on the line would talk at once.
+        if data[0] != 0 and command in self.cached_commands:
+            key = (self.mode, self.address, command, self.data_version)
+            frame = self.cached_response(key, handler, data[2:])
+            if frame is not None:
+                metrics.inc('responses', slave=self.address, command=command)
+                self.write_response(frame)
+            return
+        reply_command = command
+        try:
+            response = handler(data[2:])
+        except ModbusError as e:
+            metrics.inc('exceptions', slave=self.address, command=command, code=e.code)
+            reply_command, response = exception_reply(command, e.code)
+        if response is not None and data[0] != 0:
+            metrics.inc('responses', slave=self.address, command=command)
+            self.send_response(reply_command, response)
+
+    def cached_response(self, key, handler, *args):
+        frame = self.response_cache.get(key)
+        if frame is None:
+            _, address, command, _ = key
+            try:
+                response = handler(*args)
+            except ModbusError as e:
+                self.metrics.inc('exceptions', slave=address, command=command, code=e.code)
+                command, response = exception_reply(command, e.code)
+            if response is None:
+                return None
+            frame = bytes(self.prepare_response(command, response, address))
+            self.response_cache.put(key, frame)
+        return frame
+
+    def run_batch(self, data):
+        return run_entries(data, self.address, self.handlers, lambda handler, payload: handler(payload))
 
     def write_text(self, text):
-        print(f"Slave received text: {text.decode()}")
-        print("=================Complete Slave==================")
-
-    def read_text(self):
-        text = "Sample text from slave"
-        response = self.prepare_response(2, text.encode())
-        print("==============Completed processing===============")
-        print(f"Slave sending response: {response}")
+        if self.tracer.debug_enabled:
+            self.tracer.debug("Slave received text: %s", text.decode(errors='replace'))
+            self.tracer.debug("=================Complete Slave==================")
+
+    def read_text(self, data=b''):
+        return single_frame(self.text.encode())
+
+    def write_compressed_text(self, payload):
+        try:
+            text = decompress(payload)
+        except ValueError as e:
+            self.metrics.inc('bad_payloads', slave=self.address, command=WRITE_TEXT_COMPRESSED)
+            self.tracer.error("%s", e)
+            return None
+        return self.write_text(text)
+
+    def read_compressed_text(self, data=b''):
+        return single_frame(compress(self.text.encode()))
+
+    def send_response(self, command, data):
+        self.write_response(self.prepare_response(command, data))
+
+    def write_response(self, response):
+        tracer = self.tracer
+        if tracer.debug_enabled:
+            tracer.debug("==============Completed processing===============")
+            tracer.debug("Slave sending response: %s", bytes(response))
+        self.record_frame(SENT, response)
         self.port.write(response)
 
-    def prepare_response(self, command, data):
-        if self.mode == ASCII_MODE:
-            frame = self.prepare_ascii_frame(self.address, command, data)
-        else:
-            frame = self.prepare_rtu_frame(self.address, command, data)
-        return frame
+    def prepare_response(self, command, data, address=None):
+        if address is None:
+            address = self.address
+        return self.encoder.encode(self.mode, address, command, data)
 
     def prepare_ascii_frame(self, slave_address, command, data):
-        frame_data = f'{slave_address:02X}{command:02X}{binascii.hexlify(data).decode()}'
-        lrc = calculate_lrc(binascii.unhexlify(frame_data))
-        frame = f':{frame_data}{lrc:02X}\r\n'
-        return frame.encode()
+        return bytes(self.encoder.encode(ASCII_MODE, slave_address, command, data))
 
     def prepare_rtu_frame(self, slave_address, command, data):
-        frame = bytes([slave_address, command]) + data
-        frame += calculate_crc(frame)
-        return frame
+        return bytes(self.encoder.encode(RTU_MODE, slave_address, command, data))
     
 if __name__ == "__main__":
     slave_port = 'COM6'
 
-    slave = ModbusSlave(port=slave_port, address=1, mode=RTU_MODE)
+    slave = ModbusSlave(port=slave_port, address=1, mode=RTU_MODE, tracer=Tracer(DEBUG, history=32))
     slave.set_parameters(baudrate=9600, bytesize=8, parity='N', stopbits=1)
     slave.start()
\ No newline at end of file
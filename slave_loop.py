@@ -0,0 +1,126 @@
+import math
+import os
+import selectors
+import time
+
+
+class SlaveLoop:
+    # Serves any number of slaves, each on its own port, from one thread.
+    # Ports are read without blocking when the selector reports data; a frame
+    # ends at a CR LF (ASCII) or once the port's character timeout passes
+    # without another byte, which the select timeout is set to catch.
+    # Silence is measured from when select reported the bytes, and a port
+    # whose deadline has passed is flushed before its new bytes are fed, so
+    # a frame that follows right after t3.5 is never joined to the last one.
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        self.selector.register(self.wake_read, selectors.EVENT_READ, None)
+        self.slaves = []
+        self.deadlines = {}
+        self.running = False
+
+    def add(self, slave):
+        slave.reader.set_timeout(0)
+        self.selector.register(slave.port.fileno(), selectors.EVENT_READ, slave)
+        self.slaves.append(slave)
+
+    def remove(self, slave):
+        self.selector.unregister(slave.port.fileno())
+        self.slaves.remove(slave)
+        self.deadlines.pop(slave, None)
+
+    def next_timeout(self, now):
+        deadline = min(self.deadlines.values(), default=None)
+        for slave in self.slaves:
+            if slave.link_fallback is not None and (deadline is None or slave.link_deadline < deadline):
+                deadline = slave.link_deadline
+        if deadline is None:
+            return None
+        # epoll rounds up to whole milliseconds; round down instead so the
+        # wait never runs past the deadline.
+        return max(0.0, math.floor((deadline - now) * 1000) / 1000)
+
+    def run(self):
+        self.running = True
+        select = self.selector.select
+        while self.running:
+            events = select(self.next_timeout(time.monotonic()))
+            now = time.monotonic()
+            for key, _ in events:
+                slave = key.data
+                if slave is None:
+                    self.drain_wakeup()
+                else:
+                    self.read(slave, now)
+            self.expire(time.monotonic())
+
+    def read(self, slave, now):
+        deadline = self.deadlines.get(slave)
+        if deadline is not None and deadline <= now:
+            self.end_frame(slave)
+        port = slave.port
+        try:
+            data = port.read(port.in_waiting or 1)
+        except OSError as e:
+            # A port that fails would stay readable and spin the loop.
+            slave.metrics.inc('port_errors', slave=slave.address)
+            slave.tracer.error("Port read failed, dropping slave %s: %s", slave.address, e)
+            self.remove(slave)
+            return
+        if not data:
+            return
+        decoder = slave.reader.decoder
+        decoder.feed(data)
+        while decoder.frames:
+            self.handle(slave, decoder.next_frame())
+        if decoder.buffer:
+            self.deadlines[slave] = now + slave.character_timeout
+        else:
+            self.deadlines.pop(slave, None)
+
+    def end_frame(self, slave):
+        del self.deadlines[slave]
+        decoder = slave.reader.decoder
+        decoder.flush()
+        while decoder.frames:
+            self.handle(slave, decoder.next_frame())
+
+    def expire(self, now):
+        for slave, deadline in list(self.deadlines.items()):
+            if deadline <= now:
+                self.end_frame(slave)
+        for slave in self.slaves:
+            if slave.link_fallback is not None:
+                slave.check_link()
+
+    # One slave's failure must not stop the others sharing the loop.
+    def handle(self, slave, frame):
+        try:
+            slave.handle_frame(frame)
+        except Exception as e:
+            slave.metrics.inc('handler_errors', slave=slave.address)
+            slave.tracer.error("Failed to handle frame %s: %r", bytes(frame), e)
+
+    def drain_wakeup(self):
+        try:
+            while os.read(self.wake_read, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    # Safe to call from any thread or a signal handler; run() returns as
+    # soon as the selector wakes up.
+    def stop(self):
+        self.running = False
+        try:
+            os.write(self.wake_write, b'x')
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        self.selector.close()
+        os.close(self.wake_read)
+        os.close(self.wake_write)
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+from async_master import AsyncModbusMaster
+from registers import DataStore
+from slave import ModbusSlave, RTU_MODE
+from tracing import Tracer, OFF
+from transfer import ChunkedTransfer
+from transport import VirtualBus
+
+
+def start_slave(bus, text=''):
+    slave = ModbusSlave(bus.attach(), 1, RTU_MODE, tracer=Tracer(OFF))
+    slave.text = text
+    slave.store = DataStore(holding_registers=10)
+    threading.Thread(target=slave.start, daemon=True).start()
+    return slave
+
+
+def test_long_reply_after_short_ones():
+    # Short replies teach the master a small turnaround; a 240-byte reply
+    # still has to fit in the timeout at 9600 baud.
+    async def run():
+        bus = VirtualBus(baudrate=9600)
+        slave = start_slave(bus, 'y' * 240)
+        master = AsyncModbusMaster(bus.attach(), RTU_MODE, tracer=Tracer(OFF))
+        try:
+            for _ in range(20):
+                assert await master.read_holding_registers(1, 0, 2) is not None
+            assert await master.read_text(1) == b'y' * 240
+        finally:
+            await master.close()
+            slave.stop()
+        assert master.metrics.get('retries', slave=1) == 0
+    asyncio.run(run())
+
+
+def test_chunked_transfer():
+    async def run():
+        bus = VirtualBus()
+        slave = start_slave(bus)
+        master = AsyncModbusMaster(bus.attach(), RTU_MODE, tracer=Tracer(OFF))
+        transfer = ChunkedTransfer(master)
+        blob = bytes(range(256)) * 4
+        try:
+            assert await transfer.write(1, blob)
+            assert slave.text == blob.decode(errors='replace')
+            assert await transfer.read(1) == slave.text.encode()
+        finally:
+            await master.close()
+            slave.stop()
+    asyncio.run(run())
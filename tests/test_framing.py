@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+from framing import FrameDecoder, FrameEncoder, RTU_MODE
+from slave import ModbusSlave
+from tracing import Tracer, OFF
+from transport import VirtualBus
+
+
+def rtu_frame(address, command, data):
+    return bytes(FrameEncoder().encode(RTU_MODE, address, command, data))
+
+def feed_in_chunks(decoder, data, size):
+    for start in range(0, len(data), size):
+        decoder.feed(data[start:start + size])
+    decoder.flush()
+    return list(decoder.frames)
+
+
+def test_glued_full_size_replies():
+    # Four 255-byte replies to a 125-register read with no silence between
+    # them pile up past the overflow limit before each successor arrives.
+    frames = [rtu_frame(1, 3, bytes((250,)) + os.urandom(250)) for _ in range(4)]
+    decoder = FrameDecoder(RTU_MODE, replies=True)
+    assert feed_in_chunks(decoder, b''.join(frames), 10) == frames
+    assert decoder.discarded_bytes == 0
+
+def test_noise_before_text_reply():
+    # Command 2 has no length rule, so its frame is recovered from the CRC
+    # up to the end of the block.
+    frame = rtu_frame(1, 2, b'Sample text from slave' * 5)
+    decoder = FrameDecoder(RTU_MODE, replies=True)
+    decoder.feed(b'\x07\x99' + frame)
+    decoder.flush()
+    assert list(decoder.frames) == [frame]
+    assert decoder.discarded_bytes == 2
+
+def test_glued_chunk_frames():
+    frames = [rtu_frame(1, 66, os.urandom(252)) for _ in range(6)]
+    decoder = FrameDecoder(RTU_MODE)
+    assert feed_in_chunks(decoder, b''.join(frames), 16) == frames
+    assert decoder.discarded_bytes == 0
+
+def test_custom_frame_before_known_length_frame():
+    text = rtu_frame(1, 1, b'x' * 100)
+    read = rtu_frame(1, 3, bytes((0, 0, 0, 2)))
+    decoder = FrameDecoder(RTU_MODE)
+    decoder.feed(b'\x00\xff\x13' + text + read)
+    decoder.flush()
+    assert list(decoder.frames) == [text, read]
+    assert decoder.discarded_bytes == 3
+
+def test_noise_gives_no_frames():
+    noise = bytes(range(256)) * 80
+    decoder = FrameDecoder(RTU_MODE)
+    for start in range(0, len(noise), 37):
+        decoder.feed(noise[start:start + 37])
+    decoder.flush()
+    # Only the remainder nothing could be recovered from, as one bad frame.
+    assert len(decoder.frames) == 1
+
+
+def test_resync_on_virtual_bus():
+    # Noise written in the same burst as a frame, with no silence between.
+    bus = VirtualBus()
+    slave = ModbusSlave(bus.attach(), 1, RTU_MODE, tracer=Tracer(OFF))
+    received = []
+    slave.handlers[1] = received.append
+    threading.Thread(target=slave.start, daemon=True).start()
+    try:
+        port = bus.attach()
+        port.write(b'\x07\x99\x42' + rtu_frame(1, 1, b'after noise'))
+        deadline = time.monotonic() + 1.0
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert received == [b'after noise']
+        assert slave.reader.decoder.discarded_bytes == 3
+    finally:
+        slave.stop()
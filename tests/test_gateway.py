@@ -0,0 +1,42 @@
+import asyncio
+import threading
+
+from async_master import AsyncModbusMaster
+from gateway import ModbusGateway, MBAP_HEADER
+from link import LINK_SETTINGS, encode_proposal
+from registers import ILLEGAL_FUNCTION
+from slave import ModbusSlave, RTU_MODE
+from tracing import Tracer, OFF
+from transport import VirtualBus
+
+
+async def exchange(reader, writer, transaction_id, unit, pdu):
+    writer.write(MBAP_HEADER.pack(transaction_id, 0, len(pdu) + 1, unit) + pdu)
+    header = await reader.readexactly(MBAP_HEADER.size)
+    _, _, length, _ = MBAP_HEADER.unpack(header)
+    return await reader.readexactly(length - 1)
+
+
+def test_link_settings_are_refused():
+    async def run():
+        bus = VirtualBus()
+        slave = ModbusSlave(bus.attach(), 1, RTU_MODE, tracer=Tracer(OFF))
+        slave.text = 'ok'
+        threading.Thread(target=slave.start, daemon=True).start()
+        master = AsyncModbusMaster(bus.attach(), RTU_MODE, tracer=Tracer(OFF))
+        gateway = ModbusGateway([master], tracer=Tracer(OFF))
+        server = await gateway.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            proposal = bytes((LINK_SETTINGS,)) + encode_proposal(115200, RTU_MODE, 1.0)
+            reply = await exchange(reader, writer, 1, 1, proposal)
+            assert reply == bytes((LINK_SETTINGS | 0x80, ILLEGAL_FUNCTION))
+            assert await exchange(reader, writer, 2, 1, b'\x02') == b'\x02ok'
+            assert slave.port.baudrate == master.port.baudrate
+        finally:
+            writer.close()
+            await gateway.close()
+            await master.close()
+            slave.stop()
+    asyncio.run(run())
@@ -0,0 +1,21 @@
+import threading
+
+from master import ModbusMaster
+from server import ModbusServer
+from slave import RTU_MODE
+from tracing import Tracer, OFF
+from transport import VirtualBus
+
+
+def test_replaced_unit_is_not_served_from_cache():
+    bus = VirtualBus()
+    server = ModbusServer(bus.attach(), RTU_MODE, tracer=Tracer(OFF))
+    server.add_unit(5, text="first")
+    threading.Thread(target=server.start, daemon=True).start()
+    try:
+        master = ModbusMaster(bus.attach(), RTU_MODE, tracer=Tracer(OFF))
+        assert master.read_text(5) == b'first'
+        server.add_unit(5, text="second")
+        assert master.read_text(5) == b'second'
+    finally:
+        server.stop()
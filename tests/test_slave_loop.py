@@ -0,0 +1,31 @@
+import threading
+import time
+
+from master import ModbusMaster
+from slave import ModbusSlave, RTU_MODE
+from slave_loop import SlaveLoop
+from tracing import Tracer, OFF
+from transport import VirtualBus
+
+
+def test_batch_frames_stay_apart():
+    # Frames sent back to back, each after one t3.5 gap, reach the slave
+    # one by one instead of being joined into a single bad frame.
+    bus = VirtualBus()
+    loop = SlaveLoop()
+    slave = ModbusSlave(bus.attach(), 1, RTU_MODE, tracer=Tracer(OFF))
+    received = []
+    slave.handlers[1] = lambda text: received.append(len(text))
+    loop.add(slave)
+    thread = threading.Thread(target=loop.run)
+    thread.start()
+    try:
+        master = ModbusMaster(bus.attach(), RTU_MODE, tracer=Tracer(OFF))
+        master.send_batch([(1, 1, b'x' * 100)] * 5)
+        time.sleep(0.05)
+    finally:
+        loop.stop()
+        thread.join()
+        loop.close()
+    assert received == [100] * 5
+    assert slave.reader.decoder.discarded_bytes == 0
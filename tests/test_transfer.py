@@ -0,0 +1,75 @@
+import os
+import threading
+
+import pytest
+
+from master import ModbusMaster
+from registers import ILLEGAL_DATA_VALUE
+from server import ModbusServer
+from slave import ModbusSlave, ASCII_MODE, RTU_MODE
+from slave_loop import SlaveLoop
+from tracing import Tracer, OFF
+from transfer import ChunkedTransfer
+from transport import VirtualBus
+
+
+def start_slave(bus, mode, server=False):
+    if server:
+        slave = ModbusServer(bus.attach(), mode, tracer=Tracer(OFF))
+        slave.add_unit(1)
+    else:
+        slave = ModbusSlave(bus.attach(), 1, mode, tracer=Tracer(OFF))
+    threading.Thread(target=slave.start, daemon=True).start()
+    return slave
+
+
+@pytest.mark.parametrize('server', [False, True])
+@pytest.mark.parametrize('mode', [ASCII_MODE, RTU_MODE])
+def test_text_longer_than_a_frame(mode, server):
+    # After a chunked write the text no longer fits in a command 2 reply;
+    # the slave refuses it instead of sending an oversized frame.
+    bus = VirtualBus()
+    slave = start_slave(bus, mode, server)
+    try:
+        master = ModbusMaster(bus.attach(), mode, tracer=Tracer(OFF))
+        transfer = ChunkedTransfer(master)
+        blob = os.urandom(400).hex().encode()
+        assert transfer.write(1, blob)
+        assert master.request_pdu(1, 2, b'') == (2 | 0x80, bytes((ILLEGAL_DATA_VALUE,)))
+        assert transfer.read(1) == blob
+    finally:
+        slave.stop()
+
+
+@pytest.mark.parametrize('mode', [ASCII_MODE, RTU_MODE])
+def test_chunked_write_through_slave_loop(mode):
+    bus = VirtualBus()
+    loop = SlaveLoop()
+    slave = ModbusSlave(bus.attach(), 1, mode, tracer=Tracer(OFF))
+    loop.add(slave)
+    thread = threading.Thread(target=loop.run)
+    thread.start()
+    try:
+        master = ModbusMaster(bus.attach(), mode, tracer=Tracer(OFF))
+        blob = bytes(range(256)) * 4
+        assert ChunkedTransfer(master).write(1, blob)
+        assert slave.text == blob.decode(errors='replace')
+    finally:
+        loop.stop()
+        thread.join()
+        loop.close()
+
+def test_chunked_transfer_on_noisy_bus():
+    # Corrupted chunks are resent from the status bitmap, corrupted replies
+    # by the master's retries.
+    bus = VirtualBus(bit_error_rate=2e-4, seed=7)
+    slave = start_slave(bus, RTU_MODE)
+    try:
+        master = ModbusMaster(bus.attach(), RTU_MODE, tracer=Tracer(OFF))
+        transfer = ChunkedTransfer(master, max_stalls=10)
+        blob = os.urandom(600).hex().encode()
+        assert transfer.write(1, blob)
+        assert transfer.read(1) == blob
+    finally:
+        slave.stop()
+    assert bus.corrupted_bytes
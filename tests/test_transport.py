@@ -0,0 +1,25 @@
+import threading
+
+import pytest
+
+from slave import ModbusSlave, RTU_MODE
+from slave_loop import SlaveLoop
+from tracing import Tracer, OFF
+from transport import Transport, NullTransport
+
+
+def test_transport_methods_are_abstract():
+    with pytest.raises(TypeError):
+        Transport()
+
+def test_null_transport_in_slave_loop():
+    port = NullTransport()
+    loop = SlaveLoop()
+    loop.add(ModbusSlave(port, 1, RTU_MODE, tracer=Tracer(OFF)))
+    thread = threading.Thread(target=loop.run)
+    thread.start()
+    loop.stop()
+    thread.join(1.0)
+    assert not thread.is_alive()
+    loop.close()
+    port.close()
@@ -0,0 +1,75 @@
+import random
+
+# Modbus over serial line, section 2.5.1.1: above 19200 baud the RTU gaps are
+# fixed instead of scaling with the character time.
+FAST_LINE_T15 = 0.00075
+FAST_LINE_T35 = 0.00175
+
+# ASCII frames end with CR LF, so the character timeout only decides when a
+# partial frame is abandoned; the spec allows gaps of up to one second.
+ASCII_CHARACTER_TIMEOUT = 1.0
+
+# Extra silence a sender leaves after t3.5 between back-to-back RTU frames,
+# for the receiver's timer resolution and read latency: a few character
+# times plus a scheduling allowance.
+GAP_MARGIN_CHARACTERS = 2
+GAP_MARGIN_ALLOWANCE = 0.002
+
+
+def character_time(baudrate, bytesize=8, parity='N', stopbits=1):
+    bits = 1 + bytesize + (0 if parity == 'N' else 1) + stopbits
+    return bits / baudrate
+
+def rtu_gaps(baudrate, bytesize=8, parity='N', stopbits=1):
+    if not baudrate or baudrate > 19200:
+        return FAST_LINE_T15, FAST_LINE_T35
+    char = character_time(baudrate, bytesize, parity, stopbits)
+    return 1.5 * char, 3.5 * char
+
+def frame_gap(baudrate, bytesize=8, parity='N', stopbits=1):
+    return rtu_gaps(baudrate, bytesize, parity, stopbits)[1]
+
+def backoff_delay(attempt, base, cap, rand=random.random):
+    # "Full jitter": uniform over [0, min(cap, base * 2^attempt)], so retries
+    # from several masters or after a shared glitch do not line up again.
+    return rand() * min(cap, base * (2 ** attempt))
+
+
+class RoundTripEstimator:
+    # Smoothed round trip and deviation as in TCP (RFC 6298). The timeout
+    # doubles on consecutive losses, but only up to max_backoff times, so a
+    # dead slave costs a bounded amount of line time.
+    def __init__(self, initial, minimum=0.0, maximum=None, max_backoff=4):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_backoff = max_backoff
+        self.srtt = None
+        self.rttvar = 0.0
+        self.backoff = 1
+        self.samples = 0
+        self.losses = 0
+
+    def observe(self, sample):
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.samples += 1
+        self.backoff = 1
+
+    def timed_out(self):
+        self.losses += 1
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def timeout(self, fallback=None):
+        if self.srtt is None:
+            base = self.initial if fallback is None else fallback
+        else:
+            base = self.srtt + 4 * self.rttvar
+        timeout = max(self.minimum, base) * self.backoff
+        if self.maximum is not None:
+            timeout = min(self.maximum, timeout)
+        return timeout
@@ -0,0 +1,62 @@
+import sys
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+SENT = 'TX'
+RECEIVED = 'RX'
+
+
+class Tracer:
+    def __init__(self, level=INFO, history=0, stream=None, dump_on_error=True):
+        self.stream = stream
+        self.dump_on_error = dump_on_error
+        self.history = deque(maxlen=history) if history else None
+        self.set_level(level)
+
+    def set_level(self, level):
+        # Callers test these flags before building anything expensive, so a
+        # disabled level costs one attribute lookup.
+        self.level = level
+        self.debug_enabled = level <= DEBUG
+        self.info_enabled = level <= INFO
+        self.warning_enabled = level <= WARNING
+        self.error_enabled = level <= ERROR
+
+    def debug(self, message, *args):
+        if self.debug_enabled:
+            self.emit(message, args)
+
+    def info(self, message, *args):
+        if self.info_enabled:
+            self.emit(message, args)
+
+    def warning(self, message, *args):
+        if self.warning_enabled:
+            self.emit(message, args)
+
+    def error(self, message, *args):
+        if self.error_enabled:
+            self.emit(message, args)
+        if self.dump_on_error and self.history:
+            self.dump_history()
+
+    def emit(self, message, args):
+        if args:
+            message = message % args
+        print(message, file=self.stream or sys.stdout)
+
+    def frame(self, direction, frame):
+        if self.history is not None:
+            self.history.append((time.time(), direction, bytes(frame)))
+
+    def dump_history(self):
+        stream = self.stream or sys.stdout
+        print(f"==========Last {len(self.history)} frames==========", file=stream)
+        for timestamp, direction, frame in self.history:
+            print(f"{timestamp:.6f} {direction} {frame}", file=stream)
@@ -0,0 +1,254 @@
+import itertools
+import struct
+from collections import deque
+from registers import ModbusError, ILLEGAL_DATA_VALUE
+
+# User-defined function codes for payloads larger than one frame.
+CHUNK_BEGIN = 65
+CHUNK_DATA = 66
+CHUNK_STATUS = 67
+CHUNK_READ = 68
+
+# A frame carries at most 252 data bytes after the address and command.
+MAX_DATA = 252
+
+BEGIN = struct.Struct('>BIB')
+DATA = struct.Struct('>BH')
+STATUS = struct.Struct('>BHH')
+STATUS_REPLY = struct.Struct('>BH')
+READ = struct.Struct('>BHB')
+READ_REPLY = struct.Struct('>BHI')
+
+WRITE_CHUNK_SIZE = MAX_DATA - DATA.size
+READ_CHUNK_SIZE = MAX_DATA - READ_REPLY.size
+
+# Largest blob a slave accepts; CHUNK_BEGIN reserves the whole buffer up
+# front, so the length from a single frame must be bounded.
+MAX_TRANSFER = 1 << 20
+
+# Remaining count in a status reply when the slave has no such transfer,
+# e.g. because it restarted since CHUNK_BEGIN.
+UNKNOWN_TRANSFER = 0xFFFF
+
+
+class IncomingTransfer:
+    def __init__(self, transfer_id, length, chunk_size):
+        self.transfer_id = transfer_id
+        self.length = length
+        self.chunk_size = chunk_size
+        self.buffer = bytearray(length)
+        self.count = -(-length // chunk_size)
+        self.received = bytearray(self.count)
+        self.remaining = self.count
+
+    def add(self, seq, data):
+        if seq >= self.count or self.received[seq]:
+            return
+        start = seq * self.chunk_size
+        if len(data) != min(self.chunk_size, self.length - start):
+            return
+        self.buffer[start:start + len(data)] = data
+        self.received[seq] = 1
+        self.remaining -= 1
+
+    def bitmap(self, base, count):
+        bits = bytearray((count + 7) // 8)
+        received = self.received
+        for i in range(min(count, self.count - base)):
+            if received[base + i]:
+                bits[i >> 3] |= 1 << (i & 7)
+        return bits
+
+
+class TransferState:
+    __slots__ = ('incoming', 'snapshot', 'tag')
+
+    def __init__(self):
+        self.incoming = None
+        self.snapshot = None
+        self.tag = 0
+
+
+def transfer_state(target):
+    state = target.transfer
+    if state is None:
+        state = target.transfer = TransferState()
+    return state
+
+def single_frame(payload):
+    # Commands 2 and 73 answer with the whole text; one that no longer fits
+    # in a frame, e.g. after a chunked write, has to be read with CHUNK_READ.
+    if len(payload) > MAX_DATA:
+        raise ModbusError(ILLEGAL_DATA_VALUE)
+    return payload
+
+
+# Slave side. Each handler takes the object whose text is being transferred
+# (a ModbusSlave or a server Unit) and the request payload.
+
+def begin_transfer(target, data):
+    if len(data) != BEGIN.size:
+        return None
+    transfer_id, length, chunk_size = BEGIN.unpack(data)
+    if not 0 < chunk_size <= WRITE_CHUNK_SIZE or length > MAX_TRANSFER:
+        return None
+    incoming = IncomingTransfer(transfer_id, length, chunk_size)
+    transfer_state(target).incoming = incoming
+    if not incoming.count:
+        target.text = ''
+    return bytes([transfer_id])
+
+def receive_chunk(target, data):
+    incoming = transfer_state(target).incoming
+    if incoming is None or len(data) < DATA.size:
+        return None
+    transfer_id, seq = DATA.unpack_from(data)
+    if transfer_id != incoming.transfer_id or not incoming.remaining:
+        return None
+    incoming.add(seq, data[DATA.size:])
+    if not incoming.remaining:
+        target.text = incoming.buffer.decode(errors='replace')
+    return None
+
+def transfer_status(target, data):
+    if len(data) != STATUS.size:
+        return None
+    transfer_id, base, count = STATUS.unpack(data)
+    incoming = transfer_state(target).incoming
+    if incoming is None or incoming.transfer_id != transfer_id:
+        return STATUS_REPLY.pack(transfer_id, UNKNOWN_TRANSFER)
+    return STATUS_REPLY.pack(transfer_id, incoming.remaining) + incoming.bitmap(base, count)
+
+def read_chunk(target, data):
+    if len(data) != READ.size:
+        return None
+    tag, seq, chunk_size = READ.unpack(data)
+    if not 0 < chunk_size <= READ_CHUNK_SIZE:
+        return None
+    state = transfer_state(target)
+    # Chunk 0 takes a fresh snapshot of the text, later chunks are cut from
+    # it, so a transfer is consistent even if the text changes meanwhile.
+    # A reply under a different tag tells the master to start over.
+    if seq == 0 or state.snapshot is None or tag != state.tag:
+        state.snapshot = target.text.encode()
+        state.tag = (state.tag + 1) & 0xFF
+        seq = 0
+    snapshot = state.snapshot
+    start = seq * chunk_size
+    return READ_REPLY.pack(state.tag, seq, len(snapshot)) + snapshot[start:start + chunk_size]
+
+CHUNK_HANDLERS = {
+    CHUNK_BEGIN: begin_transfer,
+    CHUNK_DATA: receive_chunk,
+    CHUNK_STATUS: transfer_status,
+    CHUNK_READ: read_chunk,
+}
+
+
+def acknowledged(bits, index):
+    byte = index >> 3
+    return byte < len(bits) and bits[byte] >> (index & 7) & 1
+
+
+class ChunkedTransfer:
+    # Master side. Writes stream a window of chunks without waiting for
+    # replies, then ask for a bitmap of what arrived and resend only the
+    # gaps. A half-duplex line cannot overlap replies, so reads fetch one
+    # chunk per transaction and rely on the master's own retries. Both run
+    # as steps (see ModbusMaster.run_steps), so on the async master write
+    # and read return awaitables.
+    def __init__(self, master, window=16, write_chunk_size=WRITE_CHUNK_SIZE,
+                 read_chunk_size=READ_CHUNK_SIZE, max_stalls=None):
+        self.master = master
+        self.window = window
+        self.write_chunk_size = write_chunk_size
+        self.read_chunk_size = read_chunk_size
+        self.max_stalls = master.retransmissions if max_stalls is None else max_stalls
+        self.transfer_ids = itertools.count(1)
+        self.chunks_sent = 0
+        self.retransmitted = 0
+
+    def write(self, slave_address, blob):
+        view = memoryview(blob)
+        if len(view) > MAX_TRANSFER:
+            raise ValueError(f"Blob too large for a chunked transfer: {len(view)} bytes")
+        return self.run(self.write_steps(slave_address, view))
+
+    def read(self, slave_address):
+        return self.run(self.read_steps(slave_address))
+
+    def run(self, steps):
+        master = self.master
+        with master.lock:
+            return master.run_steps(steps)
+
+    def write_steps(self, slave_address, view):
+        master = self.master
+        size = self.write_chunk_size
+        transfer_id = next(self.transfer_ids) & 0xFF
+        chunks = [view[i:i + size] for i in range(0, len(view), size)]
+        reply = yield (slave_address, CHUNK_BEGIN, BEGIN.pack(transfer_id, len(view), size))
+        if reply != bytes([transfer_id]):
+            master.tracer.warning("Slave %d refused chunked transfer", slave_address)
+            return False
+
+        missing = deque(range(len(chunks)))
+        sent = set()
+        stalls = 0
+        while missing:
+            window = sorted(missing.popleft() for _ in range(min(self.window, len(missing))))
+            frames = []
+            for seq in window:
+                frames.append((slave_address, CHUNK_DATA, DATA.pack(transfer_id, seq) + chunks[seq]))
+                if seq in sent:
+                    self.retransmitted += 1
+                sent.add(seq)
+            yield from master.batch_writes(frames)
+            self.chunks_sent += len(frames)
+
+            base = window[0]
+            lost = window
+            status = yield (slave_address, CHUNK_STATUS,
+                            STATUS.pack(transfer_id, base, window[-1] - base + 1))
+            if status is not None and len(status) >= STATUS_REPLY.size:
+                reply_id, remaining = STATUS_REPLY.unpack_from(status)
+                if reply_id != transfer_id or remaining == UNKNOWN_TRANSFER:
+                    master.tracer.warning("Slave %d lost chunked transfer %d", slave_address, transfer_id)
+                    return False
+                bits = status[STATUS_REPLY.size:]
+                lost = [seq for seq in window if not acknowledged(bits, seq - base)]
+            if len(lost) == len(window):
+                stalls += 1
+                if stalls > self.max_stalls:
+                    master.tracer.warning("Chunked transfer to slave %d stalled", slave_address)
+                    return False
+            else:
+                stalls = 0
+            missing.extendleft(reversed(lost))
+        return True
+
+    def read_steps(self, slave_address):
+        size = self.read_chunk_size
+        tag = 0
+        total = None
+        parts = []
+        stalls = 0
+        while total is None or len(parts) * size < total:
+            seq = len(parts)
+            reply = yield (slave_address, CHUNK_READ, READ.pack(tag, seq, size))
+            if reply is None or len(reply) < READ_REPLY.size:
+                stalls += 1
+                if stalls > self.max_stalls:
+                    return None
+                continue
+            tag, reply_seq, total = READ_REPLY.unpack_from(reply)
+            if reply_seq != seq:
+                # The slave took a new snapshot and sent its first chunk.
+                parts = []
+                stalls += 1
+                if stalls > self.max_stalls:
+                    return None
+            else:
+                stalls = 0
+            parts.append(reply[READ_REPLY.size:])
+        return b''.join(parts)
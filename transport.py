@@ -0,0 +1,204 @@
+import fcntl
+from abc import ABC, abstractmethod
+import os
+import random
+import select
+import struct
+import termios
+import threading
+import time
+
+
+def open_transport(port):
+    # A port name opens a real serial port. Anything else is taken to be a
+    # transport already: a serial.Serial, a BusPort, or any object with the
+    # same read/write/in_waiting/timeout interface.
+    if isinstance(port, str):
+        import serial
+        return serial.Serial(port)
+    return port
+
+
+def line_settings(port):
+    return (port.baudrate, port.bytesize, port.parity, port.stopbits)
+
+
+class Transport(ABC):
+    def __init__(self):
+        self.timeout = None
+        self.baudrate = 9600
+        self.bytesize = 8
+        self.parity = 'N'
+        self.stopbits = 1
+
+    @property
+    @abstractmethod
+    def in_waiting(self):
+        pass
+
+    @abstractmethod
+    def read(self, size=1):
+        pass
+
+    @abstractmethod
+    def write(self, data):
+        pass
+
+    @abstractmethod
+    def fileno(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        while self.in_waiting:
+            self.read(self.in_waiting)
+
+    def close(self):
+        pass
+
+
+class NullTransport(Transport):
+    # Reads nothing and discards writes; for running a master or slave
+    # without a line, e.g. when replaying a capture. fileno is a pipe that
+    # is never written, so selectors and event loops can still watch it.
+    def __init__(self):
+        super().__init__()
+        self.read_fd, self.write_fd = os.pipe()
+        self.closed = False
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def read(self, size=1):
+        return b''
+
+    def write(self, data):
+        return len(data)
+
+    def fileno(self):
+        return self.read_fd
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+class VirtualBus:
+    def __init__(self, baudrate=None, bit_error_rate=0.0, seed=None):
+        self.baudrate = baudrate
+        self.bit_error_rate = bit_error_rate
+        self.random = random.Random(seed)
+        self.ports = []
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.corrupted_bytes = 0
+
+    def attach(self):
+        port = BusPort(self)
+        with self.lock:
+            self.ports.append(port)
+        return port
+
+    def detach(self, port):
+        with self.lock:
+            if port in self.ports:
+                self.ports.remove(port)
+
+    def character_time(self, port):
+        bits = 1 + port.bytesize + (0 if port.parity == 'N' else 1) + port.stopbits
+        return bits / self.baudrate
+
+    def transmit(self, sender, data):
+        # The lock stands in for the shared line: one talker at a time, and
+        # with a baud rate set it stays busy for as long as the bytes take.
+        with self.lock:
+            if self.baudrate:
+                time.sleep(len(data) * self.character_time(sender))
+            self.frames += 1
+            settings = line_settings(sender)
+            for port in self.ports:
+                if port is sender:
+                    continue
+                if line_settings(port) != settings:
+                    # A UART set to another speed or format only sees noise.
+                    port.deliver(self.random.randbytes(len(data)))
+                else:
+                    port.deliver(self.corrupt(data) if self.bit_error_rate else data)
+
+    def corrupt(self, data):
+        byte_error_rate = 1 - (1 - self.bit_error_rate) ** 8
+        rand = self.random.random
+        damaged = None
+        for i in range(len(data)):
+            if rand() < byte_error_rate:
+                if damaged is None:
+                    damaged = bytearray(data)
+                damaged[i] ^= 1 << self.random.randrange(8)
+                self.corrupted_bytes += 1
+        return bytes(damaged) if damaged is not None else data
+
+
+class BusPort(Transport):
+    def __init__(self, bus):
+        super().__init__()
+        self.bus = bus
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.write_fd, False)
+        self.poller = select.poll()
+        self.poller.register(self.read_fd, select.POLLIN)
+        self.overruns = 0
+        self.closed = False
+
+    @property
+    def in_waiting(self):
+        buf = fcntl.ioctl(self.read_fd, termios.FIONREAD, b'\0\0\0\0')
+        return struct.unpack('I', buf)[0]
+
+    def fileno(self):
+        return self.read_fd
+
+    def read(self, size=1):
+        if self.timeout is None:
+            deadline = None
+        else:
+            deadline = time.monotonic() + self.timeout
+        data = bytearray()
+        while len(data) < size:
+            if deadline is None:
+                wait = None
+            else:
+                wait = max(0, int((deadline - time.monotonic()) * 1000))
+            if not self.poller.poll(wait):
+                break
+            chunk = os.read(self.read_fd, size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
+    def write(self, data):
+        self.bus.transmit(self, bytes(data))
+        return len(data)
+
+    def deliver(self, data):
+        try:
+            written = os.write(self.write_fd, data)
+        except BlockingIOError:
+            written = 0
+        if written < len(data):
+            # Receiver is not keeping up; the bytes are lost like a UART overrun.
+            self.overruns += 1
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.bus.detach(self)
+        os.close(self.read_fd)
+        os.close(self.write_fd)